@@ -0,0 +1,175 @@
+"""
+Process-local snapshot of the product catalog.
+
+The catalog only changes through the admin write routes, so readers (catalog,
+product detail, dashboard) are served immutable ProductView objects from
+memory. Each admin write refreshes the affected product after commit and bumps
+the snapshot's monotonically increasing version, which caches can key on.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Unknown product ids remembered as missing (bounded, and only briefly, since
+# another worker may have just created the product)
+NEGATIVE_CACHE_ENTRIES = int(os.getenv("NEGATIVE_CACHE_ENTRIES", "10000"))
+NEGATIVE_CACHE_TTL = float(os.getenv("NEGATIVE_CACHE_TTL", "30"))
+
+
+@dataclass(frozen=True)
+class ProductView:
+    """Read-only copy of a product row with the accessors templates use"""
+    id: int
+    name: str
+    description: Optional[str]
+    price: float
+    category: str
+    status: str
+    gender: Optional[str]
+    image_url: Optional[str]
+    images: Tuple[str, ...]
+    sizes: Tuple[str, ...]
+    # Catalog version at which this view was loaded
+    version: int
+
+    @classmethod
+    def from_product(cls, product, version: int) -> "ProductView":
+        return cls(
+            id=product.id,
+            name=product.name,
+            description=product.description,
+            price=float(product.price or 0),
+            category=product.category,
+            status=product.status,
+            gender=product.gender,
+            image_url=product.image_url,
+            images=tuple(product.get_images_list()),
+            sizes=tuple(product.get_sizes_list()),
+            version=version,
+        )
+
+    def get_images_list(self) -> List[str]:
+        return list(self.images)
+
+    def get_sizes_list(self) -> List[str]:
+        return list(self.sizes)
+
+    def has_size(self, size) -> bool:
+        return size in self.sizes
+
+
+class CatalogSnapshot:
+    """Products by id plus the catalog version, replaced copy-on-write"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._products: Dict[int, ProductView] = {}
+        self._ordered: Optional[Tuple[Dict[int, ProductView], List[ProductView]]] = None
+        self.version = 0
+        self.ready = False
+
+    def load(self, products: Iterable, at_least: int = 0) -> None:
+        """Replace the snapshot with freshly loaded product rows"""
+        with self._lock:
+            version = max(self.version + 1, at_least)
+            self._products = {p.id: ProductView.from_product(p, version) for p in products}
+            self.version = version
+            self.ready = True
+
+    def load_views(self, views: Iterable[ProductView], version: int) -> None:
+        """Replace the snapshot with views read from a catalog snapshot file"""
+        with self._lock:
+            self._products = {view.id: view for view in views}
+            self.version = max(self.version, version)
+            self.ready = True
+
+    def refresh(self, product, at_least: int = 0) -> ProductView:
+        """
+        Store the committed state of one product and bump the version
+        (to at least `at_least`, the version another worker announced).
+        """
+        with self._lock:
+            version = max(self.version + 1, at_least)
+            view = ProductView.from_product(product, version)
+            products = dict(self._products)
+            products[view.id] = view
+            self._products = products
+            self.version = version
+            return view
+
+    def discard(self, product_id: int, at_least: int = 0) -> None:
+        """Drop a deleted product and bump the version"""
+        with self._lock:
+            products = dict(self._products)
+            products.pop(product_id, None)
+            self._products = products
+            self.version = max(self.version + 1, at_least)
+
+    def get(self, product_id: int) -> Optional[ProductView]:
+        return self._products.get(product_id)
+
+    def many(self, product_ids: Iterable[int]) -> List[ProductView]:
+        """Views for the given ids in the given order, skipping unknown ids"""
+        products = self._products
+        return [products[pid] for pid in product_ids if pid in products]
+
+    def all(self) -> List[ProductView]:
+        """Every product in id order"""
+        products = self._products
+        cached = self._ordered
+        # Only reuse the ordering built from this exact products dict
+        if cached is not None and cached[0] is products:
+            return cached[1]
+        ordered = [products[pid] for pid in sorted(products)]
+        self._ordered = (products, ordered)
+        return ordered
+
+    def __contains__(self, product_id) -> bool:
+        return product_id in self._products
+
+    def __len__(self) -> int:
+        return len(self._products)
+
+    @property
+    def max_id(self) -> int:
+        """Highest product id in the snapshot (0 when empty)"""
+        ordered = self.all()
+        return ordered[-1].id if ordered else 0
+
+
+class NegativeCache:
+    """Bounded, short-lived set of ids known not to exist"""
+
+    def __init__(self, max_entries: int = NEGATIVE_CACHE_ENTRIES, ttl: float = NEGATIVE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._expires: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            expires = self._expires.get(key)
+            if expires is None:
+                return False
+            if expires < time.monotonic():
+                del self._expires[key]
+                return False
+            return True
+
+    def add(self, key) -> None:
+        with self._lock:
+            self._expires[key] = time.monotonic() + self.ttl
+            self._expires.move_to_end(key)
+            while len(self._expires) > self.max_entries:
+                self._expires.popitem(last=False)
+
+    def discard(self, key) -> None:
+        with self._lock:
+            self._expires.pop(key, None)
+
+
+catalog = CatalogSnapshot()
+missing_products = NegativeCache()
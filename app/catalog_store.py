@@ -0,0 +1,113 @@
+"""
+JSON warm-start snapshot of the catalog for the gunicorn workers.
+
+The first worker to load the catalog from the database writes it to a file,
+and every admin write replaces that file atomically (write to a temp file,
+then os.replace). Workers that start later, including those recycled by
+max_requests, read the file instead of querying the database and decode it
+into their own in-memory catalog (app.catalog). Nothing is read from the file
+after warm-up.
+
+Layout: a fixed header (magic, catalog version, product count, generation)
+followed by one JSON array of ProductView fields per line.
+
+A file is only trusted by processes of the same generation: workers forked
+from one preloaded gunicorn master. A restarted server never reads a file left
+behind by an earlier run against a database that may have changed since.
+"""
+import json
+import os
+import struct
+import tempfile
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from app.catalog import ProductView
+
+MAGIC = b"JBHCAT02"
+HEADER = struct.Struct("<8sQI32s")
+# tmpfs on Linux (like gunicorn's worker_tmp_dir), else the temp directory
+CATALOG_SNAPSHOT_FILE = os.getenv(
+    "CATALOG_SNAPSHOT_FILE",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "jubair-catalog.snapshot"),
+)
+# Set when this module is imported; with preload_app the master imports it once
+# and every forked worker inherits the same value
+GENERATION = f"{os.getpid()}-{time.time_ns()}"
+
+FIELDS = ("id", "name", "description", "price", "category", "status", "gender",
+          "image_url", "images", "sizes", "version")
+
+
+def _record(view: ProductView) -> bytes:
+    values = [getattr(view, name) for name in FIELDS]
+    # ASCII-escaped JSON never contains a raw newline, so records are one per line
+    return json.dumps(values, separators=(",", ":")).encode("ascii") + b"\n"
+
+
+def _view(line: bytes) -> ProductView:
+    values = dict(zip(FIELDS, json.loads(line)))
+    values["images"] = tuple(values["images"])
+    values["sizes"] = tuple(values["sizes"])
+    return ProductView(**values)
+
+
+def write_snapshot(views: Iterable[ProductView], version: int, path: str = CATALOG_SNAPSHOT_FILE) -> None:
+    """Serialize catalog views and atomically replace the snapshot file"""
+    views = sorted(views, key=lambda view: view.id)
+    directory = os.path.dirname(path) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".catalog-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(HEADER.pack(MAGIC, version, len(views), GENERATION.encode("ascii")[:32]))
+            f.writelines(_record(view) for view in views)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _read_header(f) -> Optional[Tuple[int, int]]:
+    """(version, count) if the file is a snapshot of this server generation"""
+    try:
+        magic, version, count, generation = HEADER.unpack(f.read(HEADER.size))
+    except struct.error:
+        return None
+    if magic != MAGIC or generation.rstrip(b"\0").decode("ascii", "replace") != GENERATION[:32]:
+        return None
+    return version, count
+
+
+def read_snapshot(path: str = CATALOG_SNAPSHOT_FILE) -> Optional[Tuple[int, List[ProductView]]]:
+    """(catalog version, views) from the snapshot file, or None if absent, unreadable or from another generation"""
+    try:
+        with open(path, "rb") as f:
+            header = _read_header(f)
+            if header is None:
+                return None
+            version, count = header
+            views = [_view(line) for line in f]
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"WARN: ignoring unreadable catalog snapshot {path}: {e}")
+        return None
+    if len(views) != count:
+        print(f"WARN: ignoring truncated catalog snapshot {path}")
+        return None
+    return version, views
+
+
+def snapshot_version(path: str = CATALOG_SNAPSHOT_FILE) -> int:
+    """Catalog version in the snapshot file header (0 when absent or from another generation)"""
+    try:
+        with open(path, "rb") as f:
+            header = _read_header(f)
+    except OSError:
+        return 0
+    return header[0] if header else 0
@@ -0,0 +1,330 @@
+"""
+Append-only analytics event log with compaction into daily rollups.
+
+Search, view and favourite events are appended to an in-memory batch and
+written by a background thread, one write() per batch. Each worker writes its
+own segment file in EVENT_LOG_DIR (events-<pid>-<start>-<n>.open), so workers
+never interleave lines. A segment is sealed (renamed to .log) once it is big
+or old enough and on shutdown.
+
+The compactor rolls sealed segments into product_daily_stats, one additive
+upsert per segment. It records the segment name in compacted_segments in the
+same transaction and deletes the file afterwards, so a crash between the two
+steps cannot count a segment twice. A lock file in the directory lets only
+one worker compact at a time (flock, or msvcrt on Windows). Open segments
+nobody has written to for longer than a live worker keeps one open belong to
+crashed workers and are sealed first; PIDs are not used, since they repeat
+across container restarts. Trend charts read the rollups, never raw events.
+
+A line is "<unix time>\t<event>\t<product id>". SegmentLog is the generic
+batched, rotated writer; app.query_log uses it for the raw search-query log.
+"""
+import glob
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Protocol, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from sqlalchemy import func
+
+from app.models import CompactedSegment, ProductDailyStat
+from app.product_stats import additive_upsert
+
+EVENT_LOG_DIR = os.getenv("EVENT_LOG_DIR", os.path.join("analytics", "events"))
+EVENT_FLUSH_INTERVAL = float(os.getenv("EVENT_FLUSH_INTERVAL", "2"))
+EVENT_SEGMENT_BYTES = int(os.getenv("EVENT_SEGMENT_BYTES", str(4 * 1024 * 1024)))
+EVENT_SEGMENT_SECONDS = float(os.getenv("EVENT_SEGMENT_SECONDS", "300"))
+EVENT_COMPACT_INTERVAL = float(os.getenv("EVENT_COMPACT_INTERVAL", "60"))
+# Extra time past EVENT_SEGMENT_SECONDS before an unwritten open segment counts as orphaned
+ORPHAN_GRACE_SECONDS = 60
+COMPACTED_SEGMENT_RETENTION_DAYS = 7
+
+# Event name -> product_daily_stats column
+EVENT_COLUMNS = {"search": "searches", "view": "views", "favourite": "favourites"}
+
+
+class SegmentLog:
+    """Buffered, append-only writer for this worker's active segment in a directory"""
+
+    prefix = "segment"
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        self._batch: List[str] = []
+        # Serialises writes, rotation and sealing of the active segment
+        self._write_lock = threading.Lock()
+        self._segment: Optional[str] = None
+        self._segment_started = 0.0
+        self._segment_bytes = 0
+        # Keeps segment names unique when two are opened within the same millisecond
+        self._sequence = 0
+
+    def append(self, lines: List[str]) -> None:
+        """Queue newline-terminated lines (no I/O)"""
+        if lines:
+            with self._lock:
+                self._batch.extend(lines)
+
+    def flush(self) -> int:
+        """Append the queued lines to the active segment; returns how many were written"""
+        with self._lock:
+            batch, self._batch = self._batch, []
+        if not batch:
+            with self._write_lock:
+                # Quiet workers still hand over their segment once it is old enough
+                if self._segment is not None and time.time() - self._segment_started >= EVENT_SEGMENT_SECONDS:
+                    self._seal()
+            return 0
+        data = "".join(batch).encode("utf-8")
+        with self._write_lock:
+            if self._segment is not None and not os.path.exists(self._segment):
+                # Sealed as an orphan while this writer was stalled; never reuse the name
+                self._segment = None
+            if self._segment is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self._segment_started = time.time()
+                self._sequence += 1
+                self._segment = os.path.join(
+                    self.directory,
+                    f"{self.prefix}-{os.getpid()}-{int(self._segment_started * 1000)}-{self._sequence}.open",
+                )
+                self._segment_bytes = 0
+            with open(self._segment, "ab") as f:
+                f.write(data)
+            self._segment_bytes += len(data)
+            if (self._segment_bytes >= EVENT_SEGMENT_BYTES
+                    or time.time() - self._segment_started >= EVENT_SEGMENT_SECONDS):
+                self._seal()
+        return len(batch)
+
+    def seal(self) -> None:
+        """Close the active segment so the compactor can take it"""
+        with self._write_lock:
+            self._seal()
+
+    def _seal(self) -> None:
+        if self._segment is not None:
+            try:
+                os.replace(self._segment, self._segment[:-len(".open")] + ".log")
+            except FileNotFoundError:
+                pass  # already sealed as an orphan
+            self._segment = None
+
+    def sealed_segments(self) -> List[str]:
+        """Sealed segment paths, oldest first, after sealing those of crashed workers"""
+        _seal_orphans(self.directory, self.prefix, keep=self._segment)
+        return sorted(glob.glob(os.path.join(self.directory, f"{self.prefix}-*.log")))
+
+
+class CompactableLog(Protocol):
+    """A segment log that knows how to fold its sealed segments away (EventLog, QueryLog)"""
+
+    prefix: str
+
+    def flush(self) -> int: ...
+
+    def seal(self) -> None: ...
+
+    def compact(self, db) -> int: ...
+
+
+class EventLog(SegmentLog):
+    """Search, view and favourite events"""
+
+    prefix = "events"
+
+    def __init__(self, directory: str = EVENT_LOG_DIR):
+        super().__init__(directory)
+
+    def record(self, event: str, product_ids: Iterable[int]) -> None:
+        """Queue one event per product id (no I/O)"""
+        if event not in EVENT_COLUMNS:
+            raise ValueError(f"unknown analytics event: {event}")
+        now = int(time.time())
+        self.append([f"{now}\t{event}\t{int(pid)}\n" for pid in product_ids])
+
+    def compact(self, db) -> int:
+        return compact(db, self)
+
+
+def _read_segment(path: str) -> Dict[Tuple[str, int], Counter]:
+    """(day, product id) -> Counter of rollup columns for one segment"""
+    rollup: Dict[Tuple[str, int], Counter] = {}
+    days: Dict[int, str] = {}
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                ts, event, product_id = line.rstrip("\n").split("\t")
+                column = EVENT_COLUMNS[event]
+                ts, product_id = int(ts), int(product_id)
+            except (ValueError, KeyError):
+                continue  # a torn last line from a crash
+            day = days.get(ts)
+            if day is None:
+                # Local calendar day; cached since a batch shares its timestamp
+                day = days[ts] = datetime.fromtimestamp(ts).date().isoformat()
+            rollup.setdefault((day, product_id), Counter())[column] += 1
+    return rollup
+
+
+def _seal_orphans(directory: str, prefix: str, keep: Optional[str] = None) -> None:
+    """
+    Seal open segments left behind by crashed workers. A live writer seals its
+    segment within EVENT_SEGMENT_SECONDS of opening it, so one untouched for
+    longer (plus a grace period) has no writer any more.
+    """
+    cutoff = time.time() - EVENT_SEGMENT_SECONDS - ORPHAN_GRACE_SECONDS
+    for path in glob.glob(os.path.join(directory, f"{prefix}-*.open")):
+        if path == keep:
+            continue
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.replace(path, path[:-len(".open")] + ".log")
+        except FileNotFoundError:
+            pass  # sealed by its writer meanwhile
+
+
+@contextmanager
+def compaction_lock(directory: str):
+    """Yields True for the one worker allowed to compact the directory now, False for the others"""
+    os.makedirs(directory, exist_ok=True)
+    # Append mode: truncating a file another process has locked fails on Windows
+    with open(os.path.join(directory, ".compact.lock"), "a") as lock:
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            if fcntl is None:
+                lock.seek(0)
+                msvcrt.locking(lock.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def compact(db, log: SegmentLog) -> int:
+    """Roll every sealed event segment into product_daily_stats; returns the number compacted"""
+    with compaction_lock(log.directory) as acquired:
+        if not acquired:
+            return 0  # another worker is compacting
+        compacted = 0
+        for path in log.sealed_segments():
+            name = os.path.basename(path)
+            if db.get(CompactedSegment, name) is None:
+                rows = [
+                    {"day": day, "product_id": pid, **{c: counts[c] for c in EVENT_COLUMNS.values()}}
+                    for (day, pid), counts in sorted(_read_segment(path).items())
+                ]
+                try:
+                    additive_upsert(db, ProductDailyStat.__table__, ["day", "product_id"], rows)
+                    db.add(CompactedSegment(name=name))
+                    db.commit()
+                except Exception:
+                    db.rollback()
+                    raise
+            os.remove(path)
+            compacted += 1
+        # Names only guard the window between commit and delete; old ones can go
+        cutoff = datetime.now() - timedelta(days=COMPACTED_SEGMENT_RETENTION_DAYS)
+        db.query(CompactedSegment).filter(CompactedSegment.compacted_at < cutoff).delete()
+        db.commit()
+        return compacted
+
+
+def daily_totals(db, days: int = 30) -> List[dict]:
+    """Catalog-wide searches/views/favourites per day for the last `days` days, oldest first"""
+    first = date.today() - timedelta(days=days - 1)
+    rows = (
+        db.query(
+            ProductDailyStat.day,
+            func.sum(ProductDailyStat.searches),
+            func.sum(ProductDailyStat.views),
+            func.sum(ProductDailyStat.favourites),
+        )
+        .filter(ProductDailyStat.day >= first.isoformat())
+        .group_by(ProductDailyStat.day)
+        .all()
+    )
+    by_day = {day: (searches, views, favourites) for day, searches, views, favourites in rows}
+    trend = []
+    for offset in range(days):
+        day = (first + timedelta(days=offset)).isoformat()
+        searches, views, favourites = by_day.get(day, (0, 0, 0))
+        trend.append({"day": day, "searches": int(searches or 0), "views": int(views or 0),
+                      "favourites": int(favourites or 0)})
+    return trend
+
+
+class EventLogWriter:
+    """Background thread flushing segment logs and compacting their sealed segments"""
+
+    def __init__(self, logs: List[CompactableLog], interval: float = EVENT_FLUSH_INTERVAL,
+                 compact_interval: float = EVENT_COMPACT_INTERVAL):
+        self.logs = logs
+        self.interval = interval
+        self.compact_interval = compact_interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_compaction = 0.0
+
+    def register(self, log: CompactableLog) -> None:
+        if log not in self.logs:
+            self.logs.append(log)
+
+    def start(self, session_factory) -> None:
+        if self._thread is not None or session_factory is None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(session_factory,), name="event-log-writer", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the thread, write what is queued and seal the segments"""
+        self._stopping.set()
+        self._thread = None
+        for log in self.logs:
+            try:
+                log.flush()
+                log.seal()
+            except Exception as e:
+                print(f"WARN: failed to flush {log.prefix} log: {e}")
+
+    def _run(self, session_factory) -> None:
+        while not self._stopping.wait(self.interval):
+            for log in self.logs:
+                try:
+                    log.flush()
+                except Exception as e:
+                    print(f"WARN: failed to write {log.prefix} log: {e}")
+            if time.monotonic() - self._last_compaction >= self.compact_interval:
+                self._last_compaction = time.monotonic()
+                db = session_factory()
+                try:
+                    for log in self.logs:
+                        try:
+                            log.compact(db)
+                        except Exception as e:
+                            print(f"WARN: {log.prefix} log compaction failed: {e}")
+                finally:
+                    db.close()
+
+
+event_log = EventLog()
+event_writer = EventLogWriter([event_log])
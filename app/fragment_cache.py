@@ -0,0 +1,73 @@
+"""
+Rendered product-card fragment cache.
+
+Catalog grids, related products and favourites render the same per-product
+card markup again and again. Cards are rendered once per (template, product id,
+catalog version of the product) and list pages stitch the cached markup
+together. A product's fragments are replaced as soon as it is served at a newer
+version.
+
+Templates call the global registered by install_fragment_cache:
+
+    {{ product_fragment("_product_card.html", product) }}
+
+Fragment templates see only `product`, never the request context.
+"""
+import os
+import threading
+from typing import Dict, Tuple
+
+from fastapi.templating import Jinja2Templates
+from markupsafe import Markup
+
+FRAGMENT_CACHE_ENTRIES = int(os.getenv("FRAGMENT_CACHE_ENTRIES", "10000"))
+
+
+class FragmentCache:
+    """(template, product id) -> (product version, rendered markup)"""
+
+    def __init__(self, max_entries: int = FRAGMENT_CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._fragments: Dict[Tuple[str, int], Tuple[int, Markup]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, env, template_name: str, product) -> Markup:
+        version = getattr(product, "version", None)
+        if version is None:
+            # Not a catalog view (e.g. an ORM row): nothing to key the markup on
+            return Markup(env.get_template(template_name).render(product=product))
+        key = (template_name, product.id)
+        cached = self._fragments.get(key)
+        if cached is not None and cached[0] == version:
+            self.hits += 1
+            return cached[1]
+        self.misses += 1
+        markup = Markup(env.get_template(template_name).render(product=product))
+        with self._lock:
+            if len(self._fragments) >= self.max_entries and key not in self._fragments:
+                self._fragments.clear()
+            self._fragments[key] = (version, markup)
+        return markup
+
+    def discard(self, product_id: int) -> None:
+        """Drop every fragment of a deleted product"""
+        with self._lock:
+            for key in [key for key in self._fragments if key[1] == product_id]:
+                del self._fragments[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._fragments.clear()
+
+
+fragment_cache = FragmentCache()
+
+
+def install_fragment_cache(templates: Jinja2Templates) -> None:
+    """Expose product_fragment() to a router's templates"""
+    env = templates.env
+    env.globals["product_fragment"] = lambda template_name, product: fragment_cache.render(
+        env, template_name, product
+    )
@@ -0,0 +1,232 @@
+"""
+Cross-worker invalidation bus for the per-process catalog caches.
+
+Gunicorn runs several workers, each holding its own catalog snapshot and
+search index. After an admin write, the worker that handled it publishes a
+"product X changed at catalog version N" event and every other worker
+refreshes that product within milliseconds.
+
+  postgres  LISTEN/NOTIFY on the application database
+  socket    one Unix datagram socket per worker in a shared directory
+            (SQLite deployments and local runs)
+
+INVALIDATION_BUS selects one of them, "auto" (the default) picks by database
+dialect, and "off" disables fan-out for single-process runs.
+"""
+import json
+import os
+import select
+import socket
+import tempfile
+import threading
+from typing import Callable, Optional
+
+from sqlalchemy import text as sql_text
+
+INVALIDATION_BUS = os.getenv("INVALIDATION_BUS", "auto").lower()
+INVALIDATION_SOCKET_DIR = os.getenv(
+    "INVALIDATION_SOCKET_DIR", os.path.join(tempfile.gettempdir(), "jubair-invalidation")
+)
+NOTIFY_CHANNEL = "catalog_changed"
+# Seconds between listener wake-ups (to notice shutdown) and reconnect attempts
+POLL_INTERVAL = 1.0
+RECONNECT_DELAY = 2.0
+
+# Handler receives {"product_id": int or None, "version": int}; a None product id
+# means events may have been missed and the whole catalog should be reloaded
+EventHandler = Callable[[dict], None]
+
+
+def _encode(product_id: Optional[int], version: int) -> str:
+    return json.dumps({"product_id": product_id, "version": version, "origin": os.getpid()})
+
+
+def _decode(payload) -> Optional[dict]:
+    try:
+        event = json.loads(payload)
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(event, dict) or event.get("origin") == os.getpid():
+        return None
+    return event
+
+
+class PostgresNotifyTransport:
+    """Events as NOTIFY payloads, received by a LISTEN connection per worker"""
+    name = "postgres"
+
+    def __init__(self, engine):
+        self.engine = engine
+
+    def publish(self, payload: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(sql_text("SELECT pg_notify(:channel, :payload)"),
+                         {"channel": NOTIFY_CHANNEL, "payload": payload})
+
+    def listen(self, deliver: Callable[[str], None], stopping: threading.Event) -> None:
+        first = True
+        while not stopping.is_set():
+            raw = None
+            try:
+                raw = self.engine.raw_connection()
+                dbapi_conn = raw.driver_connection
+                # A listening autocommit connection must never go back to the pool;
+                # once detached, close() really closes it
+                raw.detach()
+                dbapi_conn.autocommit = True
+                with dbapi_conn.cursor() as cursor:
+                    cursor.execute(f"LISTEN {NOTIFY_CHANNEL}")
+                if not first:
+                    # Notifications sent while disconnected are lost
+                    deliver(None)
+                first = False
+                while not stopping.is_set():
+                    if select.select([dbapi_conn], [], [], POLL_INTERVAL)[0]:
+                        dbapi_conn.poll()
+                        while dbapi_conn.notifies:
+                            deliver(dbapi_conn.notifies.pop(0).payload)
+            except Exception as e:
+                print(f"WARN: invalidation listener lost its connection: {e}")
+                stopping.wait(RECONNECT_DELAY)
+            finally:
+                if raw is not None:
+                    try:
+                        raw.close()
+                    except Exception:
+                        pass
+
+    def close(self) -> None:
+        pass
+
+
+class UnixSocketTransport:
+    """Events sent as datagrams to every worker socket in a shared directory"""
+    name = "socket"
+
+    def __init__(self, directory: str = INVALIDATION_SOCKET_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, f"{os.getpid()}.sock")
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        self.sock.settimeout(POLL_INTERVAL)
+
+    def publish(self, payload: str) -> None:
+        data = payload.encode("utf-8")
+        sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for entry in os.listdir(self.directory):
+                path = os.path.join(self.directory, entry)
+                if not entry.endswith(".sock") or path == self.path:
+                    continue
+                try:
+                    sender.sendto(data, path)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # Socket left behind by a worker that exited
+                    try:
+                        os.unlink(path)
+                    except OSError:
+                        pass
+                except OSError as e:
+                    print(f"WARN: failed to notify worker socket {entry}: {e}")
+        finally:
+            sender.close()
+
+    def listen(self, deliver: Callable[[str], None], stopping: threading.Event) -> None:
+        while not stopping.is_set():
+            try:
+                data = self.sock.recv(65536)
+            except socket.timeout:
+                continue
+            except OSError:
+                if stopping.is_set():
+                    break
+                raise
+            deliver(data.decode("utf-8", errors="replace"))
+
+    def close(self) -> None:
+        self.sock.close()
+        try:
+            os.unlink(self.path)
+        except OSError:
+            pass
+
+
+class InvalidationBus:
+    """Publishes local catalog changes and applies other workers' changes"""
+
+    def __init__(self):
+        self.transport = None
+        self._handler: Optional[EventHandler] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = threading.Event()
+
+    def start(self, engine, handler: EventHandler) -> None:
+        """Open the transport for this worker and start the listener thread"""
+        if self.transport is not None or engine is None:
+            return
+        kind = INVALIDATION_BUS
+        if kind == "auto":
+            kind = "postgres" if engine.dialect.name == "postgresql" else "socket"
+        try:
+            if kind == "postgres":
+                self.transport = PostgresNotifyTransport(engine)
+            elif kind == "socket" and hasattr(socket, "AF_UNIX"):
+                self.transport = UnixSocketTransport()
+            else:
+                if kind != "off":
+                    print(f"WARN: invalidation bus '{kind}' unavailable; cross-worker invalidation disabled")
+                return
+        except Exception as e:
+            print(f"WARN: invalidation bus failed to start: {e}")
+            self.transport = None
+            return
+        self._handler = handler
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="catalog-invalidation", daemon=True)
+        self._thread.start()
+        print(f"DEBUG: Invalidation bus listening via {self.transport.name} (pid {os.getpid()})")
+
+    def publish(self, product_id: Optional[int], version: int) -> None:
+        """Tell the other workers that a product changed (never raises)"""
+        if self.transport is None:
+            return
+        try:
+            self.transport.publish(_encode(product_id, version))
+        except Exception as e:
+            print(f"WARN: failed to publish invalidation for product {product_id}: {e}")
+
+    def stop(self) -> None:
+        if self.transport is None:
+            return
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=POLL_INTERVAL * 2)
+        self.transport.close()
+        self.transport = None
+        self._thread = None
+
+    def _run(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self.transport.listen(self._deliver, self._stopping)
+            except Exception as e:
+                print(f"WARN: invalidation listener failed: {e}")
+                self._stopping.wait(RECONNECT_DELAY)
+
+    def _deliver(self, payload) -> None:
+        if payload is None:
+            event = {"product_id": None, "version": 0}
+        else:
+            event = _decode(payload)
+            if event is None:
+                return
+        try:
+            self._handler(event)
+        except Exception as e:
+            print(f"WARN: failed to apply invalidation {event}: {e}")
+
+
+bus = InvalidationBus()
@@ -2,8 +2,13 @@ from fastapi import FastAPI, Request, Depends, status
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from fastapi.responses import HTMLResponse
-from app.database import engine, Base, get_db
+from app.database import engine, Base, get_db, SessionLocal
 from app.routers import auth, products
+from app.invalidation import bus
+from app.event_log import event_writer
+from app.query_log import query_log
+from app.product_stats import stats_flusher
+from app.recommendations import periodic_rebuild, rebuild_from_db
 import uvicorn
 from starlette.responses import RedirectResponse
 from starlette.middleware.base import BaseHTTPMiddleware
@@ -29,6 +34,40 @@ app.include_router(products.router)
 # Templates
 templates = Jinja2Templates(directory="templates")
 
+@app.on_event("startup")
+async def warm_catalog():
+    """Load the catalog snapshot and search index before serving requests"""
+    if SessionLocal is None:
+        return
+    # Merged search counts first: the search index ranks suggestions by them
+    stats_flusher.start(SessionLocal, products.apply_flushed_counts)
+    db = SessionLocal()
+    try:
+        products.ensure_catalog(db)
+    except Exception as e:
+        print(f"WARN: catalog warm-up failed: {e}")
+    try:
+        rebuild_from_db(db)
+    except Exception as e:
+        print(f"WARN: recommendation build failed: {e}")
+    finally:
+        db.close()
+    # Fan catalog changes out to (and receive them from) the other workers
+    bus.start(engine, products.apply_remote_change)
+    # Pick up favourites added through other workers
+    periodic_rebuild.start(SessionLocal)
+    # Write analytics events and search queries; roll sealed segments into daily stats and sketches
+    event_writer.register(query_log)
+    event_writer.start(SessionLocal)
+
+@app.on_event("shutdown")
+async def stop_invalidation_bus():
+    """Close this worker's invalidation listener and background jobs, flushing buffered counts"""
+    bus.stop()
+    periodic_rebuild.stop()
+    stats_flusher.stop()
+    event_writer.stop()
+
 # Note: Session management is now handled client-side via JavaScript
 # The middleware has been removed to improve performance
 
@@ -1,9 +1,22 @@
-from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, Text, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.database import Base
 import json
+import re
 from datetime import datetime
 
+SIZE_SPLIT_RE = re.compile(r"[,\s]+")
+GENDERS = ("Male", "Female")
+
+def split_sizes(values):
+    """Normalize size input ("7,8 9" style entries) into a de-duplicated list"""
+    sizes = []
+    for value in values or []:
+        for part in SIZE_SPLIT_RE.split(str(value)):
+            if part and part not in sizes:
+                sizes.append(part)
+    return sizes
+
 class Admin(Base):
     __tablename__ = "admins"
     
@@ -31,15 +44,23 @@ class Product(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     name = Column(String(100), nullable=False)
     description = Column(Text, nullable=True)
-    price = Column(Float, nullable=False)
+    price = Column(Float, nullable=False, index=True)
     category = Column(String(50), nullable=False)
     status = Column(String(20), default="Available", nullable=False)  # Available or Out of Stock
+    gender = Column(String(10), nullable=True, index=True)  # Male, Female or unset
     image_url = Column(String(255), nullable=True)
     images = Column(Text, nullable=True)  # JSON array of uploaded image paths
-    sizes = Column(Text, nullable=True)  # JSON array of available sizes
+    sizes = Column(Text, nullable=True)  # Legacy JSON array of sizes, superseded by product_sizes
     
     # Relationships
     favourited_by = relationship("UserFavourite", back_populates="product")
+    size_rows = relationship(
+        "ProductSize",
+        back_populates="product",
+        cascade="all, delete-orphan",
+        order_by="ProductSize.id",
+        lazy="selectin"
+    )
     
     def get_images_list(self):
         """Get uploaded images as a list, excluding the main image_url to avoid duplication"""
@@ -57,23 +78,51 @@ class Product(Base):
         return images
     
     def get_sizes_list(self):
-        """Get available sizes as a list"""
-        sizes = []
+        """Get in-stock sizes as a list"""
+        if self.size_rows:
+            return [row.size for row in self.size_rows if row.stock_quantity > 0]
         
+        # Products not yet migrated into product_sizes still carry the JSON column
+        sizes = []
         if self.sizes:
             try:
                 sizes_data = json.loads(self.sizes)
                 if isinstance(sizes_data, list):
-                    sizes.extend(sizes_data)
+                    sizes.extend(split_sizes(sizes_data))
             except (json.JSONDecodeError, TypeError):
                 pass
             
         return sizes
     
+    def set_sizes(self, sizes):
+        """Replace the product's sizes, keeping stock levels of sizes that remain"""
+        wanted = split_sizes(sizes)
+        existing = {row.size: row for row in self.size_rows}
+        self.size_rows = [
+            existing.get(size) or ProductSize(size=size, stock_quantity=1)
+            for size in wanted
+        ]
+        self.sizes = None
+    
     def has_size(self, size):
         """Check if a specific size is available"""
         return size in self.get_sizes_list()
 
+class ProductSize(Base):
+    __tablename__ = "product_sizes"
+    __table_args__ = (
+        # "size 9 in stock" lookups: size first, then the products carrying it
+        Index("ix_product_sizes_size_product", "size", "product_id"),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    product_id = Column(Integer, ForeignKey("products.id"), nullable=False)
+    size = Column(String(20), nullable=False)
+    stock_quantity = Column(Integer, default=1, nullable=False)
+    
+    # Relationships
+    product = relationship("Product", back_populates="size_rows")
+
 class UserFavourite(Base):
     __tablename__ = "user_favourites"
     
@@ -87,6 +136,47 @@ class UserFavourite(Base):
     user = relationship("User", back_populates="favourites")
     product = relationship("Product", back_populates="favourited_by")
 
+class ProductStat(Base):
+    """
+    Materialized per-product analytics, merged additively by every worker
+    (see app.product_stats). The admin analytics page reads its top rows.
+    """
+    __tablename__ = "product_stats"
+    __table_args__ = (
+        # ORDER BY ... DESC LIMIT n for the analytics dashboard; the only index,
+        # since every flush upsert has to maintain each one
+        Index("ix_product_stats_searches_favourites", "searches", "favourites"),
+    )
+    
+    # No foreign key: counts outlive deleted products and are written without joins
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
+    searches = Column(Integer, default=0, server_default="0", nullable=False)
+    views = Column(Integer, default=0, server_default="0", nullable=False)
+    # Current number of users favouriting the product
+    favourites = Column(Integer, default=0, server_default="0", nullable=False)
+    last_activity = Column(DateTime, nullable=True)
+
+class ProductDailyStat(Base):
+    """Per-day, per-product event rollups written by the event-log compactor (app.event_log)"""
+    __tablename__ = "product_daily_stats"
+    __table_args__ = (
+        # One product's trend: its days in order
+        Index("ix_product_daily_stats_product_day", "product_id", "day"),
+    )
+    
+    day = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
+    searches = Column(Integer, default=0, server_default="0", nullable=False)
+    views = Column(Integer, default=0, server_default="0", nullable=False)
+    favourites = Column(Integer, default=0, server_default="0", nullable=False)
+
+class CompactedSegment(Base):
+    """Event-log segments already rolled into product_daily_stats (guards against double counting)"""
+    __tablename__ = "compacted_segments"
+    
+    name = Column(String(255), primary_key=True)
+    compacted_at = Column(DateTime, default=datetime.now, nullable=False)
+
 class Session(Base):
     __tablename__ = "sessions"
     
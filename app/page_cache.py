@@ -0,0 +1,127 @@
+"""
+Full-page HTML cache for anonymous catalog and product pages.
+
+Rendered pages are kept in a bounded in-process LRU. The key is the route,
+its normalized query string and the catalog version, so an admin write (which
+bumps the version) makes every older page unreachable without explicit
+purging. Each page carries a strong ETag, and requests whose If-None-Match
+matches it get an empty 304.
+
+Only visitors without a session cookie are served from the cache. Admin and
+user pages still render per request.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Hashable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import HTMLResponse, Response
+
+PAGE_CACHE_ENTRIES = int(os.getenv("PAGE_CACHE_ENTRIES", "512"))
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+# Cookies that mark a logged-in admin or user
+SESSION_COOKIES = ("session_id", "user_session_id")
+
+
+@dataclass(frozen=True)
+class CachedPage:
+    """Rendered page body with its validator and any data the route needs on a hit"""
+    body: bytes
+    etag: str
+    # Product ids shown on the page (catalog searches still count them on hits)
+    product_ids: Tuple[int, ...] = ()
+    # (search stage, match count) of a catalog search, logged again on hits
+    search_meta: Tuple = ()
+
+
+def is_anonymous(request: Request) -> bool:
+    return not any(request.cookies.get(name) for name in SESSION_COOKIES)
+
+
+def make_etag(body: bytes) -> str:
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Whether the request's If-None-Match header lists this ETag"""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+class PageCache:
+    """LRU of rendered pages bounded by entry count and total body bytes"""
+
+    def __init__(self, max_entries: int = PAGE_CACHE_ENTRIES, max_bytes: int = PAGE_CACHE_MAX_BYTES):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Hashable, CachedPage]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, request: Request, version: int) -> Optional[Hashable]:
+        """Cache key for an anonymous request, or None when the page must not be cached"""
+        if request.method != "GET" or not is_anonymous(request):
+            return None
+        # Blank parameters (empty form fields) do not change the page
+        params = tuple(sorted((k, v) for k, v in request.query_params.multi_items() if v != ""))
+        # Templates build absolute URLs, so scheme and host are part of the page
+        return (request.url.scheme, request.url.netloc, request.url.path, params, version)
+
+    def get(self, key: Optional[Hashable]) -> Optional[CachedPage]:
+        if key is None:
+            return None
+        with self._lock:
+            page = self._entries.get(key)
+            if page is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return page
+
+    def put(self, key: Hashable, body: bytes, product_ids: Tuple[int, ...] = (),
+            search_meta: Tuple = ()) -> CachedPage:
+        page = CachedPage(body, make_etag(body), tuple(product_ids), tuple(search_meta))
+        if len(body) > self.max_bytes:
+            return page
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.body)
+            self._entries[key] = page
+            self._bytes += len(body)
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.body)
+        return page
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def respond(self, request: Request, page: CachedPage) -> Response:
+        """200 with the cached body, or 304 when the client already has it"""
+        headers = {"ETag": page.etag, "Cache-Control": "no-cache", "Vary": "Cookie"}
+        if etag_matches(request, page.etag):
+            return Response(status_code=304, headers=headers)
+        return HTMLResponse(content=page.body, headers=headers)
+
+    def store(self, request: Request, key: Optional[Hashable], response: Response,
+              product_ids: Tuple[int, ...] = (), search_meta: Tuple = ()) -> Response:
+        """Cache a freshly rendered 200 page and answer this request from it"""
+        if key is None or response.status_code != 200:
+            return response
+        page = self.put(key, bytes(response.body), product_ids, search_meta)
+        return self.respond(request, page)
+
+
+page_cache = PageCache()
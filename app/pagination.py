@@ -0,0 +1,82 @@
+"""
+Keyset (cursor) pagination helpers for catalog listings.
+
+A cursor is the (sort_key, id) pair of the last item on the previous page,
+encoded as an opaque URL-safe token. Pages are cut from an already sorted
+sequence with bisect, so fetching page N costs the same as fetching page 1.
+"""
+import base64
+import json
+import math
+from bisect import bisect_right
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 24
+MAX_PAGE_SIZE = 96
+
+
+def clamp_page_size(page_size: Optional[int]) -> int:
+    """Keep a requested page size within sane bounds"""
+    if not page_size or page_size < 1:
+        return DEFAULT_PAGE_SIZE
+    return min(page_size, MAX_PAGE_SIZE)
+
+
+def encode_cursor(sort_key: Any, item_id: int) -> str:
+    """Opaque cursor for the item a page ended on"""
+    raw = json.dumps([sort_key, item_id], separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, int]]:
+    """
+    (sort_key, id) from a cursor, or None for a missing or malformed one. Sort
+    keys are always a finite number or a string; anything else is forged.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        decoded = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        return None
+    if not isinstance(decoded, list) or len(decoded) != 2:
+        return None
+    sort_key, item_id = decoded
+    if isinstance(item_id, bool) or not isinstance(item_id, int):
+        return None
+    if isinstance(sort_key, bool) or not isinstance(sort_key, (int, float, str)):
+        return None
+    if isinstance(sort_key, float) and not math.isfinite(sort_key):
+        return None
+    return sort_key, item_id
+
+
+def keyset_slice(
+    ordered: Sequence[Tuple[Any, int]],
+    after: Optional[Tuple[Any, int]],
+    page_size: int,
+    include: Optional[Callable[[int], bool]] = None,
+) -> Tuple[List[int], Optional[str]]:
+    """
+    Ids of the page following `after` in an ascending (sort_key, id) sequence,
+    plus the cursor for the next page (None on the last page).
+    """
+    start = 0
+    if after is not None:
+        try:
+            start = bisect_right(ordered, tuple(after))
+        except TypeError:
+            start = 0  # cursor from a different sort order
+    page: List[Tuple[Any, int]] = []
+    for pos in range(start, len(ordered)):
+        key = ordered[pos]
+        if include is None or include(key[1]):
+            page.append(key)
+            if len(page) > page_size:
+                break
+    next_cursor = None
+    if len(page) > page_size:
+        page = page[:page_size]
+        next_cursor = encode_cursor(*page[-1])
+    return [item_id for _, item_id in page], next_cursor
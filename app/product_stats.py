@@ -0,0 +1,240 @@
+"""
+Buffered per-product counters (search appearances, detail-page views,
+favourites) stored in the materialized product_stats table.
+
+Requests only bump an in-memory Counter in their own worker. A background
+thread swaps the buffers out every interval, or early once a buffer holds
+max_pending increments. It merges them into product_stats with one
+multi-row additive upsert (count = count + excluded.count). Every worker can
+therefore write concurrently without losing increments, and no file or
+database I/O happens on the request path. For buffers that keep totals, the
+durable totals (which include the other workers' counts) are read back after
+each flush and handed to a callback, e.g. to refresh search popularity. A
+failed flush puts its counts back into the buffer for the next attempt, and
+shutdown drains every buffer.
+"""
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+
+from app.models import Product, ProductStat, UserFavourite
+
+PRODUCT_STATS_FLUSH_INTERVAL = float(os.getenv("PRODUCT_STATS_FLUSH_INTERVAL", "10"))
+PRODUCT_VIEWS_FLUSH_EVENTS = int(os.getenv("PRODUCT_VIEWS_FLUSH_EVENTS", "1000"))
+# Rows per INSERT statement
+UPSERT_BATCH = 500
+
+
+class CounterBuffer:
+    """Unflushed increments of one product_stats column in this worker"""
+
+    def __init__(self, column: str, keep_totals: bool = False, max_pending: int = 0):
+        self.column = column
+        self.keep_totals = keep_totals
+        # Wake the flusher early once this many increments are waiting (0 = timer only)
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending: Counter = Counter()
+        self._pending_events = 0
+        # Set by the StatsFlusher this buffer is registered with
+        self._wake: Optional[threading.Event] = None
+        # Durable totals as of the last flush (only read back when keep_totals is set)
+        self.totals: Dict[int, int] = {}
+
+    def add(self, product_ids: Iterable[int], amount: int = 1) -> None:
+        with self._lock:
+            for product_id in product_ids:
+                self._pending[product_id] += amount
+                self._pending_events += 1
+            full = self.max_pending and self._pending_events >= self.max_pending
+        if full and self._wake is not None:
+            self._wake.set()
+
+    def drain(self) -> Counter:
+        """Take every pending increment, leaving the buffer empty"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._pending_events = 0
+        return pending
+
+    def restore(self, counts: Counter) -> None:
+        """Put back increments whose flush failed"""
+        with self._lock:
+            self._pending.update(counts)
+            self._pending_events += sum(abs(n) for n in counts.values())
+
+    def pending(self) -> int:
+        return self._pending_events
+
+
+def additive_upsert(db, table, keys: List[str], rows: List[dict], overwrite: Iterable[str] = ()) -> None:
+    """
+    Insert rows, adding their other columns onto the existing row when the key
+    columns already exist; columns in overwrite replace the stored value instead
+    (caller commits). Every row must carry the same columns.
+    """
+    if not rows:
+        return
+    overwrite = set(overwrite)
+    columns = [name for name in rows[0] if name not in keys]
+    dialect = db.get_bind().dialect.name
+    for start in range(0, len(rows), UPSERT_BATCH):
+        batch = rows[start:start + UPSERT_BATCH]
+        if dialect == "mysql":
+            stmt = mysql.insert(table).values(batch)
+            new = stmt.inserted
+        else:
+            insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            stmt = insert(table).values(batch)
+            new = stmt.excluded
+        updates = {name: new[name] if name in overwrite else table.c[name] + new[name] for name in columns}
+        if dialect == "mysql":
+            stmt = stmt.on_duplicate_key_update(updates)
+        else:
+            stmt = stmt.on_conflict_do_update(index_elements=[table.c[name] for name in keys], set_=updates)
+        db.execute(stmt)
+
+
+def upsert_counts(db, column: str, counts: Dict[int, int]) -> None:
+    """
+    Add counts to product_stats.<column> and touch last_activity (caller commits).
+    Positive counts insert missing rows. Negative ones (favourites removed) only
+    lower existing rows, never below zero, so no row starts out negative.
+    """
+    now = datetime.now()
+    rows = [{"product_id": pid, column: int(n), "last_activity": now} for pid, n in sorted(counts.items()) if n > 0]
+    additive_upsert(db, ProductStat.__table__, ["product_id"], rows, overwrite=["last_activity"])
+    by_delta: Dict[int, List[int]] = {}
+    for pid, n in sorted(counts.items()):
+        if n < 0:
+            by_delta.setdefault(int(n), []).append(pid)
+    value = getattr(ProductStat, column)
+    for delta, product_ids in by_delta.items():
+        for start in range(0, len(product_ids), UPSERT_BATCH):
+            db.query(ProductStat).filter(
+                ProductStat.product_id.in_(product_ids[start:start + UPSERT_BATCH])
+            ).update(
+                {value: case((value + delta < 0, 0), else_=value + delta), ProductStat.last_activity: now},
+                synchronize_session=False,
+            )
+
+
+def refresh_favourite_counts(db) -> None:
+    """Recompute product_stats.favourites from user_favourites (caller commits)"""
+    counts = dict(
+        db.query(UserFavourite.product_id, func.count(UserFavourite.id)).group_by(UserFavourite.product_id)
+    )
+    rows = [{"product_id": pid, "favourites": int(n)} for pid, n in sorted(counts.items())]
+    additive_upsert(db, ProductStat.__table__, ["product_id"], rows, overwrite=["favourites"])
+    stale = db.query(ProductStat).filter(ProductStat.favourites != 0)
+    if counts:
+        stale = stale.filter(ProductStat.product_id.notin_(list(counts)))
+    stale.update({ProductStat.favourites: 0}, synchronize_session=False)
+
+
+def top_products(db, limit: int = 50):
+    """(ProductStat, product name) rows, most searched then most favourited first"""
+    return (
+        db.query(ProductStat, Product.name)
+        .join(Product, Product.id == ProductStat.product_id)
+        .order_by(ProductStat.searches.desc(), ProductStat.favourites.desc())
+        .limit(limit)
+        .all()
+    )
+
+
+def load_totals(db, column: str) -> Dict[int, int]:
+    """{product_id: count} for every product with a non-zero count"""
+    value = getattr(ProductStat, column)
+    return {pid: int(count) for pid, count in db.query(ProductStat.product_id, value).filter(value > 0)}
+
+
+class StatsFlusher:
+    """Background thread merging every registered buffer into product_stats"""
+
+    def __init__(self, buffers: List[CounterBuffer], interval: float = PRODUCT_STATS_FLUSH_INTERVAL):
+        self.buffers = buffers
+        self.interval = interval
+        self._stopping = threading.Event()
+        # Set by a buffer that reached max_pending, or by stop()
+        self._wake = threading.Event()
+        for buffer in buffers:
+            buffer._wake = self._wake
+        self._thread: Optional[threading.Thread] = None
+        self._session_factory = None
+        self._on_flush: Optional[Callable[[CounterBuffer], None]] = None
+        # One flush at a time (the timer and shutdown can race)
+        self._flush_lock = threading.Lock()
+
+    def start(self, session_factory, on_flush: Optional[Callable[[CounterBuffer], None]] = None) -> None:
+        """Load current totals, then flush every interval seconds (or when a buffer fills) until stop()"""
+        if self._thread is not None or session_factory is None:
+            return
+        self._session_factory = session_factory
+        self._on_flush = on_flush
+        self.flush()
+        self._stopping.clear()
+        self._wake.clear()
+        self._thread = threading.Thread(target=self._run, name="product-stats-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the timer and drain what is left"""
+        self._stopping.set()
+        self._wake.set()
+        self._thread = None
+        if self._session_factory is not None:
+            self.flush()
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                return
+            self.flush()
+
+    def flush(self) -> None:
+        with self._flush_lock:
+            for buffer in self.buffers:
+                self._flush_buffer(buffer)
+
+    def _flush_buffer(self, buffer: CounterBuffer) -> None:
+        counts = buffer.drain()
+        db = self._session_factory()
+        try:
+            if counts:
+                try:
+                    upsert_counts(db, buffer.column, counts)
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    buffer.restore(counts)
+                    print(f"WARN: failed to flush {buffer.column} counts ({sum(counts.values())} pending): {e}")
+                    return
+            if not buffer.keep_totals:
+                return
+            buffer.totals = load_totals(db, buffer.column)
+        except Exception as e:
+            print(f"WARN: failed to load {buffer.column} totals: {e}")
+            return
+        finally:
+            db.close()
+        if self._on_flush is not None:
+            try:
+                self._on_flush(buffer)
+            except Exception as e:
+                print(f"WARN: product stats flush callback failed: {e}")
+
+
+search_counts = CounterBuffer("searches", keep_totals=True)
+# Net favourite changes (+1 added, -1 removed)
+favourite_counts = CounterBuffer("favourites")
+# Product detail page views; busy workers flush early instead of growing the buffer
+view_counts = CounterBuffer("views", max_pending=PRODUCT_VIEWS_FLUSH_EVENTS)
+stats_flusher = StatsFlusher([search_counts, favourite_counts, view_counts])
@@ -0,0 +1,105 @@
+"""
+Stale-while-revalidate cache with single-flight computation for catalog queries.
+
+Entries are fresh for a soft TTL and only while the catalog version they were
+computed at is current. After that they stay servable until a hard TTL:
+the first request to see a stale entry starts one background refresh and
+everyone keeps getting the stale value until it lands. Misses are coalesced
+too, so only one computation per key runs at a time and concurrent requests
+await its result. Right after an admin edit (a version bump), a popular search
+is therefore recomputed once, not once per request.
+
+Computations run in the default thread pool; they must open their own database
+session, because they can outlive the request that started them.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Hashable, Tuple
+
+QUERY_CACHE_SOFT_TTL = float(os.getenv("QUERY_CACHE_SOFT_TTL", "30"))
+QUERY_CACHE_HARD_TTL = float(os.getenv("QUERY_CACHE_HARD_TTL", "300"))
+QUERY_CACHE_ENTRIES = int(os.getenv("QUERY_CACHE_ENTRIES", "1024"))
+
+
+@dataclass(frozen=True)
+class _Entry:
+    value: Any
+    version: int
+    computed_at: float
+
+
+class QueryCache:
+    """Bounded LRU of computed values with soft/hard TTLs and request coalescing"""
+
+    def __init__(self, soft_ttl: float = QUERY_CACHE_SOFT_TTL, hard_ttl: float = QUERY_CACHE_HARD_TTL,
+                 max_entries: int = QUERY_CACHE_ENTRIES):
+        self.soft_ttl = soft_ttl
+        self.hard_ttl = hard_ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, asyncio.Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+
+    async def get(self, key: Hashable, version: int, compute: Callable[[], Any]) -> Tuple[Any, int]:
+        """
+        (value, version it was computed at) for key. Fresh entries are returned
+        as is, stale ones trigger a background refresh, misses wait for the one
+        in-flight computation.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+        if entry is not None:
+            age = now - entry.computed_at
+            if entry.version == version and age < self.soft_ttl:
+                self.hits += 1
+                return entry.value, entry.version
+            if age < self.hard_ttl:
+                self.stale_hits += 1
+                self._flight(key, version, compute)
+                return entry.value, entry.version
+        self.misses += 1
+        entry = await self._flight(key, version, compute)
+        return entry.value, entry.version
+
+    def _flight(self, key: Hashable, version: int, compute: Callable[[], Any]) -> asyncio.Future:
+        """The running computation for key, starting one if none is in flight"""
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(self._compute(key, version, compute))
+            self._inflight[key] = future
+            future.add_done_callback(lambda done: self._finish(key, done))
+        return future
+
+    async def _compute(self, key: Hashable, version: int, compute: Callable[[], Any]) -> _Entry:
+        value = await asyncio.get_running_loop().run_in_executor(None, compute)
+        entry = _Entry(value, version, time.monotonic())
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return entry
+
+    def _finish(self, key: Hashable, future: asyncio.Future) -> None:
+        if self._inflight.get(key) is future:
+            del self._inflight[key]
+        if not future.cancelled() and future.exception() is not None:
+            # Nobody awaits background refreshes; report their failures here
+            print(f"WARN: catalog query refresh failed for {key}: {future.exception()}")
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+catalog_query_cache = QueryCache()
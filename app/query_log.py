@@ -0,0 +1,219 @@
+"""
+Raw search-query log plus heavy-hitter reports.
+
+Each catalog search appends "<unix time>\t<stage>\t<matches>\t<query>" to the
+worker's query segment in QUERY_LOG_DIR (a SegmentLog, see app.event_log). The
+query is normalized to lowercase tokens, the stage says which part of the
+search cascade answered it ("all", "fuzzy", "any", or "fallback:category",
+"fallback:similar", "fallback:latest" when nothing matched), and matches is
+the number of real text matches. Writes are batched by the event-log writer
+thread.
+
+The compactor turns each sealed segment into two Space-Saving sketches (all
+queries, and queries with no matches) and merges them into the stored ones.
+Each sketch tracks at most QUERY_SKETCH_CAPACITY queries, so the reports use
+bounded memory however many distinct queries users type. The sketches live in one JSON file, replaced
+atomically together with the names of the segments already folded in. Folded
+segments are kept as .done files for QUERY_LOG_RETENTION_DAYS as the raw log.
+"""
+import glob
+import heapq
+import json
+import os
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from app.event_log import SegmentLog, compaction_lock
+from app.search import tokenize
+
+QUERY_LOG_DIR = os.getenv("QUERY_LOG_DIR", os.path.join("analytics", "queries"))
+QUERY_SKETCH_CAPACITY = int(os.getenv("QUERY_SKETCH_CAPACITY", "500"))
+QUERY_LOG_RETENTION_DAYS = int(os.getenv("QUERY_LOG_RETENTION_DAYS", "30"))
+MAX_QUERY_LENGTH = 100
+# Segment names remembered in the sketch file to make folding idempotent
+FOLDED_SEGMENT_NAMES = 1000
+
+
+def normalize_query(text: Optional[str]) -> str:
+    """Lowercase alphanumeric tokens joined by single spaces, truncated"""
+    return " ".join(tokenize(text))[:MAX_QUERY_LENGTH]
+
+
+class SpaceSaving:
+    """
+    Space-Saving heavy-hitter sketch: at most `capacity` counters. A new item
+    replaces the smallest counter and inherits its count as overestimate
+    (error), so every item counted more than total/capacity times is kept.
+    """
+
+    def __init__(self, capacity: int = QUERY_SKETCH_CAPACITY):
+        self.capacity = capacity
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        # (count, item) min-heap; entries go stale as counts grow and are fixed when popped
+        self._heap: List[Tuple[int, str]] = []
+
+    def offer(self, item: str, weight: int = 1) -> None:
+        if item in self.counts:
+            self.counts[item] += weight
+            return
+        error = 0
+        if len(self.counts) >= self.capacity:
+            error = self._evict()
+        self.counts[item] = error + weight
+        self.errors[item] = error
+        heapq.heappush(self._heap, (self.counts[item], item))
+
+    def _evict(self) -> int:
+        """Drop the smallest counter and return its count"""
+        while True:
+            count, item = self._heap[0]
+            current = self.counts.get(item)
+            if current is None:
+                heapq.heappop(self._heap)
+            elif current != count:
+                heapq.heapreplace(self._heap, (current, item))
+            else:
+                heapq.heappop(self._heap)
+                del self.counts[item]
+                del self.errors[item]
+                return count
+
+    def merge(self, other: "SpaceSaving") -> None:
+        """
+        Fold another sketch into this one (e.g. one per log segment). An item
+        missing from a full sketch may have been counted up to that sketch's
+        smallest counter, so it is charged that much as count and error.
+        """
+        floor = min(self.counts.values()) if len(self.counts) >= self.capacity else 0
+        other_floor = min(other.counts.values()) if len(other.counts) >= other.capacity else 0
+        merged = {}
+        for item in set(self.counts) | set(other.counts):
+            count = self.counts.get(item, floor) + other.counts.get(item, other_floor)
+            error = self.errors.get(item, floor) + other.errors.get(item, other_floor)
+            merged[item] = (count, error)
+        ranked = heapq.nsmallest(self.capacity, merged.items(), key=lambda kv: (-kv[1][0], kv[0]))
+        self.counts = {item: count for item, (count, _) in ranked}
+        self.errors = {item: error for item, (_, error) in ranked}
+        self._heap = [(count, item) for item, count in self.counts.items()]
+        heapq.heapify(self._heap)
+
+    def top(self, limit: int) -> List[dict]:
+        """Largest counters first: query, count and the most it may be overestimated by"""
+        ranked = heapq.nsmallest(limit, self.counts.items(), key=lambda kv: (-kv[1], kv[0]))
+        return [{"query": item, "count": count, "error": self.errors[item]} for item, count in ranked]
+
+    def to_dict(self) -> dict:
+        return {"capacity": self.capacity, "counts": self.counts, "errors": self.errors}
+
+    @classmethod
+    def from_counts(cls, counts: Dict[str, int], capacity: int = QUERY_SKETCH_CAPACITY) -> "SpaceSaving":
+        """Sketch of exact counts; the largest are offered first, so they are kept exactly"""
+        sketch = cls(capacity)
+        for item, count in sorted(counts.items(), key=lambda kv: (-kv[1], kv[0])):
+            sketch.offer(item, count)
+        return sketch
+
+    @classmethod
+    def from_dict(cls, data: dict, capacity: int = QUERY_SKETCH_CAPACITY) -> "SpaceSaving":
+        sketch = cls(capacity)
+        counts = data.get("counts", {})
+        errors = data.get("errors", {})
+        # Keep the largest counters if the capacity was lowered
+        for item, count in sorted(counts.items(), key=lambda kv: -kv[1])[:capacity]:
+            sketch.counts[item] = int(count)
+            sketch.errors[item] = int(errors.get(item, 0))
+        sketch._heap = [(count, item) for item, count in sketch.counts.items()]
+        heapq.heapify(sketch._heap)
+        return sketch
+
+
+class QueryLog(SegmentLog):
+    """What users typed into the catalog search"""
+
+    prefix = "queries"
+
+    def __init__(self, directory: str = QUERY_LOG_DIR):
+        super().__init__(directory)
+        self.sketch_file = os.path.join(directory, "sketches.json")
+
+    def record(self, query: Optional[str], matches: int, stage: str) -> None:
+        """Queue one search (no I/O)"""
+        normalized = normalize_query(query)
+        if normalized:
+            self.append([f"{int(time.time())}\t{stage}\t{int(matches)}\t{normalized}\n"])
+
+    def _load(self) -> Tuple[SpaceSaving, SpaceSaving, List[str]]:
+        try:
+            with open(self.sketch_file, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            data = {}
+        return (SpaceSaving.from_dict(data.get("top", {}), QUERY_SKETCH_CAPACITY),
+                SpaceSaving.from_dict(data.get("zero", {}), QUERY_SKETCH_CAPACITY),
+                list(data.get("segments", [])))
+
+    def compact(self, db=None) -> int:
+        """Fold sealed segments into the sketches; returns the number folded"""
+        with compaction_lock(self.directory) as acquired:
+            if not acquired:
+                return 0
+            paths = self.sealed_segments()
+            if paths:
+                top, zero, folded = self._load()
+                done = set(folded)
+                for path in paths:
+                    name = os.path.basename(path)
+                    if name in done:
+                        continue
+                    queries, zero_queries = _read_segment(path)
+                    top.merge(SpaceSaving.from_counts(queries, top.capacity))
+                    zero.merge(SpaceSaving.from_counts(zero_queries, zero.capacity))
+                    folded.append(name)
+                self._save(top, zero, folded[-FOLDED_SEGMENT_NAMES:])
+                for path in paths:
+                    os.replace(path, path[:-len(".log")] + ".done")
+            self._prune()
+            return len(paths)
+
+    def _save(self, top: SpaceSaving, zero: SpaceSaving, folded: List[str]) -> None:
+        tmp = f"{self.sketch_file}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"top": top.to_dict(), "zero": zero.to_dict(), "segments": folded}, f)
+        os.replace(tmp, self.sketch_file)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - QUERY_LOG_RETENTION_DAYS * 86400
+        for path in glob.glob(os.path.join(self.directory, f"{self.prefix}-*.done")):
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+    def report(self, limit: int = 20) -> dict:
+        """Top queries and top zero-result queries as of the last compaction"""
+        try:
+            top, zero, _ = self._load()
+        except Exception as e:
+            print(f"WARN: failed to read query sketches: {e}")
+            return {"top": [], "zero": []}
+        return {"top": top.top(limit), "zero": zero.top(limit)}
+
+
+def _read_segment(path: str) -> Tuple[Counter, Counter]:
+    """(all queries, zero-match queries) counted in one segment"""
+    queries: Counter = Counter()
+    zero_queries: Counter = Counter()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                _, _, matches, query = line.rstrip("\n").split("\t", 3)
+                matches = int(matches)
+            except ValueError:
+                continue  # a torn last line from a crash
+            queries[query] += 1
+            if matches == 0:
+                zero_queries[query] += 1
+    return queries, zero_queries
+
+
+query_log = QueryLog()
@@ -0,0 +1,210 @@
+"""
+"Customers also favourited" recommendations from user_favourites.
+
+A full build turns every (user, product) favourite into a sparse binary
+user x product matrix X and computes the item-item co-occurrence X^T X in one
+sparse product. Cosine similarity is the co-occurrence divided by the
+square-rooted favourite counts of both products. Each product's top-k
+neighbours are picked with argpartition. Building from 100k favourites takes
+seconds, not a Python double loop.
+
+Between full builds, favourites added or removed in this worker are applied
+incrementally. The co-occurrence counts are updated for that user's other
+favourites, and only the affected products' neighbour lists are recomputed.
+Each worker also rebuilds periodically to pick up other workers' changes.
+"""
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from scipy import sparse
+
+from app.models import UserFavourite
+
+RECOMMENDATION_K = 8
+# Seconds between full rebuilds in each worker
+RECOMMENDATION_REBUILD_INTERVAL = float(os.getenv("RECOMMENDATION_REBUILD_INTERVAL", "600"))
+
+
+def _top_k(ids: np.ndarray, scores: np.ndarray, k: int) -> List[Tuple[int, float]]:
+    """k highest scores (ties broken by lower id) as (id, score) pairs"""
+    if len(ids) > k:
+        # Everything scoring at least the k-th best survives, so ties are resolved by id below
+        kth = np.partition(scores, len(scores) - k)[len(scores) - k]
+        keep = scores >= kth
+        ids, scores = ids[keep], scores[keep]
+    order = np.lexsort((ids, -scores))[:k]
+    return [(int(ids[i]), float(scores[i])) for i in order]
+
+
+class AlsoFavourited:
+    """Product id -> top-k (product id, cosine similarity) by shared favouriters"""
+
+    def __init__(self, k: int = RECOMMENDATION_K):
+        self.k = k
+        self._lock = threading.RLock()
+        self._user_items: Dict[int, Set[int]] = {}
+        self._item_counts: Dict[int, int] = {}
+        self._co: Dict[int, Dict[int, int]] = {}
+        self._neighbours: Dict[int, Tuple[Tuple[int, float], ...]] = {}
+        # Bumped whenever the neighbour lists change so cached pages showing them can key on it
+        self.version = 0
+        self.ready = False
+
+    def build(self, favourites: Iterable[Tuple[int, int]]) -> float:
+        """Recompute everything from (user_id, product_id) pairs; returns seconds taken"""
+        started = time.perf_counter()
+        pairs = np.array(list(favourites), dtype=np.int64).reshape(-1, 2)
+        users, user_index = np.unique(pairs[:, 0], return_inverse=True)
+        products, product_index = np.unique(pairs[:, 1], return_inverse=True)
+        matrix = sparse.csr_matrix(
+            (np.ones(len(pairs)), (user_index, product_index)),
+            shape=(len(users), len(products)),
+        )
+        matrix.data[:] = 1.0  # duplicate favourites count once
+        counts = np.asarray(matrix.sum(axis=0)).ravel()
+        co = (matrix.T @ matrix).tocsr()
+        co.setdiag(0)
+        co.eliminate_zeros()
+        norms = np.sqrt(counts)
+        rows = np.repeat(np.arange(co.shape[0]), np.diff(co.indptr))
+        similarity = co.data / (norms[rows] * norms[co.indices])
+
+        neighbours = {}
+        co_rows: Dict[int, Dict[int, int]] = {}
+        for row in range(co.shape[0]):
+            start, end = co.indptr[row], co.indptr[row + 1]
+            product_id = int(products[row])
+            neighbour_ids = products[co.indices[start:end]]
+            co_rows[product_id] = dict(zip(neighbour_ids.tolist(), co.data[start:end].astype(int).tolist()))
+            if end > start:
+                neighbours[product_id] = tuple(_top_k(neighbour_ids, similarity[start:end], self.k))
+
+        user_items: Dict[int, Set[int]] = {}
+        for user_id, product_id in pairs.tolist():
+            user_items.setdefault(user_id, set()).add(product_id)
+
+        with self._lock:
+            self._user_items = user_items
+            self._item_counts = dict(zip(products.tolist(), counts.astype(int).tolist()))
+            self._co = co_rows
+            # A periodic rebuild that finds nothing new keeps the cached pages
+            if neighbours != self._neighbours:
+                self._neighbours = neighbours
+                self.version += 1
+            self.ready = True
+        return time.perf_counter() - started
+
+    def add(self, user_id: int, product_id: int) -> None:
+        """Apply a new favourite"""
+        with self._lock:
+            items = self._user_items.setdefault(user_id, set())
+            if product_id in items:
+                return
+            row = self._co.setdefault(product_id, {})
+            for other in items:
+                row[other] = row.get(other, 0) + 1
+                other_row = self._co.setdefault(other, {})
+                other_row[product_id] = other_row.get(product_id, 0) + 1
+            items.add(product_id)
+            self._item_counts[product_id] = self._item_counts.get(product_id, 0) + 1
+            self._refresh(product_id)
+
+    def remove(self, user_id: int, product_id: int) -> None:
+        """Apply a removed favourite"""
+        with self._lock:
+            items = self._user_items.get(user_id)
+            if not items or product_id not in items:
+                return
+            items.discard(product_id)
+            for other in items:
+                for a, b in ((product_id, other), (other, product_id)):
+                    a_row = self._co.get(a, {})
+                    if a_row.get(b, 0) > 1:
+                        a_row[b] -= 1
+                    else:
+                        a_row.pop(b, None)
+            count = self._item_counts.get(product_id, 0) - 1
+            if count > 0:
+                self._item_counts[product_id] = count
+            else:
+                self._item_counts.pop(product_id, None)
+            # Products that just lost co-occurrence with product_id need new lists too
+            self._refresh(product_id, items)
+
+    def _refresh(self, product_id: int, extra: Iterable[int] = ()) -> None:
+        # product_id's favourite count changed, so every cosine involving it did
+        affected = {product_id} | set(self._co.get(product_id, {})) | set(extra)
+        for pid in affected:
+            row = self._co.get(pid)
+            if not row:
+                self._neighbours.pop(pid, None)
+                continue
+            ids = np.fromiter(row.keys(), dtype=np.int64, count=len(row))
+            shared = np.fromiter(row.values(), dtype=np.float64, count=len(row))
+            other_counts = np.fromiter((self._item_counts.get(i, 0) for i in ids), dtype=np.float64, count=len(row))
+            similarity = shared / np.sqrt(self._item_counts.get(pid, 0) * other_counts)
+            self._neighbours[pid] = tuple(_top_k(ids, similarity, self.k))
+        self.version += 1
+
+    def for_product(self, product_id: int, limit: Optional[int] = None) -> List[int]:
+        """Ids of products most often favourited together with this one"""
+        neighbours = self._neighbours.get(product_id, ())
+        return [pid for pid, _ in neighbours[:limit]]
+
+    def for_products(self, product_ids: Iterable[int], limit: int = RECOMMENDATION_K) -> List[int]:
+        """Recommendations for a set of products (e.g. a user's favourites), summing similarities"""
+        seen = set(product_ids)
+        totals: Dict[int, float] = {}
+        for product_id in seen:
+            for pid, score in self._neighbours.get(product_id, ()):
+                if pid not in seen:
+                    totals[pid] = totals.get(pid, 0.0) + score
+        ranked = sorted(totals.items(), key=lambda item: (-item[1], item[0]))
+        return [pid for pid, _ in ranked[:limit]]
+
+
+also_favourited = AlsoFavourited()
+
+
+def rebuild_from_db(db) -> None:
+    """Full rebuild from the user_favourites table"""
+    pairs = db.query(UserFavourite.user_id, UserFavourite.product_id).all()
+    also_favourited.build(pairs)
+
+
+class PeriodicRebuild:
+    """Background thread rebuilding the recommendations every interval seconds"""
+
+    def __init__(self, interval: float = RECOMMENDATION_REBUILD_INTERVAL):
+        self.interval = interval
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, session_factory) -> None:
+        if self._thread is not None or session_factory is None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(session_factory,), name="recommendation-rebuild", daemon=True
+        )
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stopping.set()
+        self._thread = None
+
+    def _run(self, session_factory) -> None:
+        while not self._stopping.wait(self.interval):
+            db = session_factory()
+            try:
+                rebuild_from_db(db)
+            except Exception as e:
+                print(f"WARN: recommendation rebuild failed: {e}")
+            finally:
+                db.close()
+
+
+periodic_rebuild = PeriodicRebuild()
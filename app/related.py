@@ -0,0 +1,154 @@
+"""
+Precomputed "You might also like" lists for the product detail page.
+
+Each product's related products are chosen ahead of time: same category
+first, nearest price next, and more shared sizes to break price ties. When a
+category has too few other products, the list is filled from other categories
+with the products whose name and description are most alike (see
+app.similarity), then the nearest-priced ones. Lists are kept in a lookup table and
+recomputed incrementally, only for the products a write can affect, so the
+detail page does a dictionary lookup instead of a query.
+"""
+import threading
+from bisect import bisect_left, insort
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from app.similarity import content_similarity
+
+RELATED_LIMIT = 4
+
+
+class RelatedProducts:
+    """Product id -> ids of its related products, best first"""
+
+    def __init__(self, limit: int = RELATED_LIMIT):
+        self.limit = limit
+        self._lock = threading.RLock()
+        self._products: Dict[int, object] = {}
+        # Ascending (price, id) per category and across the whole catalog
+        self._by_category: Dict[str, List[Tuple[float, int]]] = {}
+        self._by_price: List[Tuple[float, int]] = []
+        self._related: Dict[int, Tuple[int, ...]] = {}
+        # Reverse index (who lists a product) and products filled from other categories
+        self._listed_by: Dict[int, Set[int]] = {}
+        self._filled: Set[int] = set()
+
+    def build(self, products: Iterable) -> None:
+        """Recompute every list from an iterable of catalog views"""
+        with self._lock:
+            self._products = {p.id: p for p in products}
+            self._by_category = {}
+            for product in self._products.values():
+                self._by_category.setdefault(product.category, []).append(self._price_key(product))
+            for keys in self._by_category.values():
+                keys.sort()
+            self._by_price = sorted(self._price_key(p) for p in self._products.values())
+            self._related = {}
+            self._listed_by = {}
+            self._filled = set()
+            for product_id in self._products:
+                self._recompute(product_id)
+
+    def upsert(self, product) -> None:
+        """Add or replace a product and refresh the lists it can appear in"""
+        with self._lock:
+            previous = self._products.get(product.id)
+            affected = self._detach(product.id)
+            self._products[product.id] = product
+            insort(self._by_category.setdefault(product.category, []), self._price_key(product))
+            insort(self._by_price, self._price_key(product))
+            affected.add(product.id)
+            affected.update(pid for _, pid in self._by_category[product.category])
+            if previous is not None:
+                affected.update(pid for _, pid in self._by_category.get(previous.category, ()))
+            affected.update(self._filled)
+            for product_id in affected:
+                if product_id in self._products:
+                    self._recompute(product_id)
+
+    def remove(self, product_id: int) -> None:
+        """Drop a product and refresh the lists it appeared in"""
+        with self._lock:
+            affected = self._detach(product_id)
+            for old in self._related.pop(product_id, ()):
+                listed = self._listed_by.get(old)
+                if listed is not None:
+                    listed.discard(product_id)
+            self._listed_by.pop(product_id, None)
+            self._filled.discard(product_id)
+            for other_id in affected | self._filled:
+                if other_id in self._products:
+                    self._recompute(other_id)
+
+    def for_product(self, product_id: int) -> List[int]:
+        return list(self._related.get(product_id, ()))
+
+    def _price_key(self, product) -> Tuple[float, int]:
+        return (float(product.price or 0), product.id)
+
+    def _detach(self, product_id: int) -> Set[int]:
+        """Remove a product from the sorted arrays; returns the products listing it"""
+        product = self._products.pop(product_id, None)
+        if product is None:
+            return set()
+        key = self._price_key(product)
+        for keys in (self._by_category.get(product.category), self._by_price):
+            if keys:
+                pos = bisect_left(keys, key)
+                if pos < len(keys) and keys[pos] == key:
+                    del keys[pos]
+        if not self._by_category.get(product.category):
+            self._by_category.pop(product.category, None)
+        return set(self._listed_by.get(product_id, ()))
+
+    def _nearest(self, product, keys: List[Tuple[float, int]], exclude: Set[int], count: int) -> List[int]:
+        """Up to count ids nearest in price to product, shared sizes breaking price ties"""
+        price = float(product.price or 0)
+        pos = bisect_left(keys, (price, product.id))
+        left, right = pos - 1, pos
+        candidates: List[Tuple[float, int]] = []
+        cutoff: Optional[float] = None
+        while left >= 0 or right < len(keys):
+            left_gap = price - keys[left][0] if left >= 0 else None
+            right_gap = keys[right][0] - price if right < len(keys) else None
+            if right_gap is None or (left_gap is not None and left_gap <= right_gap):
+                gap, pid = left_gap, keys[left][1]
+                left -= 1
+            else:
+                gap, pid = right_gap, keys[right][1]
+                right += 1
+            if cutoff is not None and gap > cutoff:
+                break
+            if pid in exclude:
+                continue
+            candidates.append((gap, pid))
+            if len(candidates) == count:
+                cutoff = gap  # keep collecting equally near products for the size tie-break
+        sizes = set(product.sizes)
+        candidates.sort(key=lambda c: (c[0], -len(sizes.intersection(self._products[c[1]].sizes)), c[1]))
+        return [pid for _, pid in candidates[:count]]
+
+    def _recompute(self, product_id: int) -> None:
+        product = self._products[product_id]
+        for old in self._related.get(product_id, ()):
+            listed = self._listed_by.get(old)
+            if listed is not None:
+                listed.discard(product_id)
+        related = self._nearest(product, self._by_category.get(product.category, []), {product_id}, self.limit)
+        if len(related) < self.limit:
+            exclude = {pid for _, pid in self._by_category.get(product.category, [])} | {product_id}
+            related += [
+                pid for pid in content_similarity.similar(product_id, self.limit - len(related), exclude)
+                if pid in self._products
+            ]
+            if len(related) < self.limit:
+                related += self._nearest(product, self._by_price, exclude | set(related), self.limit - len(related))
+            self._filled.add(product_id)
+        else:
+            self._filled.discard(product_id)
+        self._related[product_id] = tuple(related)
+        for pid in related:
+            self._listed_by.setdefault(pid, set()).add(product_id)
+
+
+related_products = RelatedProducts()
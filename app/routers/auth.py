@@ -5,11 +5,17 @@ from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from app.database import get_db
 from app.models import Admin, User, UserFavourite, Product, Session
+from app.catalog import catalog
+from app.event_log import event_log
+from app.fragment_cache import install_fragment_cache
+from app.product_stats import favourite_counts
+from app.recommendations import also_favourited
 import secrets
 from datetime import datetime, timedelta
 
 router = APIRouter(prefix="/auth", tags=["Authentication"])
 templates = Jinja2Templates(directory="templates")
+install_fragment_cache(templates)
 
 # Password hashing
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -18,6 +24,12 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 SESSION_DURATION_DAYS = 7
 SESSION_DURATION_SECONDS = SESSION_DURATION_DAYS * 24 * 60 * 60
 
+def _favourite_views(favourites):
+    """Catalog snapshot views for favourited products (cached cards), else the ORM rows"""
+    if not catalog.ready:
+        return [fav.product for fav in favourites]
+    return catalog.many(fav.product_id for fav in favourites)
+
 def verify_password(plain_password, hashed_password):
     return pwd_context.verify(plain_password, hashed_password)
 
@@ -392,6 +404,9 @@ async def add_to_favourites(
         new_favourite = UserFavourite(user_id=user_id, product_id=product_id)
         db.add(new_favourite)
         db.commit()
+        also_favourited.add(user_id, product_id)
+        event_log.record("favourite", [product_id])
+        favourite_counts.add([product_id])
         return {"success": True, "message": "Added to favourites"}
     except Exception as e:
         db.rollback()
@@ -422,6 +437,8 @@ async def remove_from_favourites(
         if favourite:
             db.delete(favourite)
             db.commit()
+            also_favourited.remove(user_id, product_id)
+            favourite_counts.add([product_id], -1)
             return {"success": True, "message": "Removed from favourites"}
         else:
             return {"success": False, "message": "Product not in favourites"}
@@ -504,7 +521,9 @@ async def user_favourites(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url="/auth/user/login", status_code=status.HTTP_302_FOUND)
     
     favourites = db.query(UserFavourite).filter(UserFavourite.user_id == user_id).all()
-    favourite_products = [fav.product for fav in favourites]
+    favourite_products = _favourite_views(favourites)
+    # Products other users favourited alongside these
+    recommended_products = catalog.many(also_favourited.for_products(fav.product_id for fav in favourites))
     
     return templates.TemplateResponse("user_favourites.html", {
         "request": request,
@@ -517,7 +536,8 @@ async def user_favourites(request: Request, db: Session = Depends(get_db)):
             "user_id": user.id,
             "type": current_session.user_type
         },
-        "favourites": favourite_products
+        "favourites": favourite_products,
+        "recommended_products": recommended_products
     })
 
 @router.get("/admin/users", response_class=HTMLResponse)
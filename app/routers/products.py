@@ -2,11 +2,26 @@ from fastapi import APIRouter, Depends, HTTPException, Request, Form, Query, sta
 from fastapi.responses import RedirectResponse, HTMLResponse
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
-from app.models import Product
+from app.models import Product, GENDERS
 from app.routers.auth import get_current_admin, get_current_session
 from sqlalchemy.orm import Session
 from sqlalchemy import select
-from app.database import get_db
+from app.database import get_db, SessionLocal
+from app.catalog import catalog, missing_products
+from app.catalog_store import read_snapshot, snapshot_version, write_snapshot
+from app.invalidation import bus
+from app.event_log import daily_totals, event_log
+from app.fragment_cache import fragment_cache, install_fragment_cache
+from app.page_cache import page_cache
+from app.product_stats import search_counts, top_products, view_counts
+from app.query_cache import catalog_query_cache
+from app.query_log import query_log
+from app.recommendations import also_favourited
+from app.related import related_products
+from app.search import SORT_ORDERS, SUGGEST_LIMIT, IdBitmap, search_index
+from app.similarity import content_similarity
+from app.search_backends import get_search_backend
+from app.pagination import clamp_page_size, decode_cursor, encode_cursor, keyset_slice
 from typing import Optional, List
 import os
 import json
@@ -17,62 +32,139 @@ from sqlalchemy import func
 
 router = APIRouter(prefix="/products", tags=["Products"])
 templates = Jinja2Templates(directory="templates")
+install_fragment_cache(templates)
 
 # Product categories
 CATEGORIES = ["Sports", "Casual", "Formal", "Boots", "Sneakers", "Sandals"]
 SIZES = ["6", "7", "8", "9", "10", "11", "12"]
 STATUSES = ["Available", "Out of Stock"]
+# Catalog sort options (app.search.SORT_ORDERS); search results default to relevance
+SORT_LABELS = [
+    ("newest", "Newest"),
+    ("price_asc", "Price: low to high"),
+    ("price_desc", "Price: high to low"),
+    ("name", "Name"),
+]
 
 # Ensure uploads directory exists
 UPLOADS_DIR = "static/uploads"
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
-# Analytics file storage (for search counts)
-ANALYTICS_DIR = "analytics"
-SEARCH_STATS_FILE = os.path.join(ANALYTICS_DIR, "search_stats.json")
-GENDER_MAP_FILE = os.path.join(ANALYTICS_DIR, "gender_map.json")
-os.makedirs(ANALYTICS_DIR, exist_ok=True)
-
-def _load_search_stats() -> dict:
-    try:
-        if os.path.exists(SEARCH_STATS_FILE):
-            with open(SEARCH_STATS_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
-    except Exception as e:
-        print(f"WARN: failed to load search stats: {e}")
-    return {}
-
-def _save_search_stats(stats: dict) -> None:
-    try:
-        with open(SEARCH_STATS_FILE, "w", encoding="utf-8") as f:
-            json.dump(stats, f)
-    except Exception as e:
-        print(f"WARN: failed to save search stats: {e}")
+# Search counts are buffered per worker and merged into product_stats (app.product_stats)
+# Products listed on the admin analytics page
+ANALYTICS_ROWS = 50
 
 def _increment_search_counts(product_ids: List[int]):
     if not product_ids:
         return
-    stats = _load_search_stats()
-    for pid in product_ids:
-        key = str(pid)
-        stats[key] = int(stats.get(key, 0)) + 1
-    _save_search_stats(stats)
-
-def _load_gender_map() -> dict:
+    search_counts.add(product_ids)
+
+def apply_flushed_counts(buffer) -> None:
+    """Stats flusher callback: rank suggestions by the merged search counts of every worker"""
+    if buffer is search_counts:
+        search_index.set_popularity(buffer.totals)
+
+def _build_catalog_indexes() -> None:
+    """Rebuild the search index, similarity matrix and related-product lists from the catalog snapshot"""
+    products = catalog.all()
+    search_index.build(products)
+    search_index.set_popularity(search_counts.totals)
+    # Related lists are filled from the similarity matrix, so it goes first
+    content_similarity.build(products)
+    related_products.build(products)
+
+def _index_product(product) -> None:
+    search_index.upsert(product)
+    content_similarity.upsert(product)
+    related_products.upsert(product)
+
+def ensure_catalog(db: Session) -> None:
+    """Load the catalog snapshot and build the search index on first use"""
+    if not catalog.ready or not search_index.ready:
+        if not _load_catalog_file():
+            reload_catalog(db)
+
+def _load_catalog_file() -> bool:
+    """Warm up from the snapshot file written by another worker, without the database"""
+    snapshot = read_snapshot()
+    if snapshot is None:
+        return False
+    version, views = snapshot
+    catalog.load_views(views, version)
+    _build_catalog_indexes()
+    print(f"DEBUG: Catalog loaded from snapshot file with {len(catalog)} products (version {catalog.version})")
+    return True
+
+def _save_catalog_file() -> None:
+    """Atomically replace the snapshot file when this worker's catalog is newer"""
     try:
-        if os.path.exists(GENDER_MAP_FILE):
-            with open(GENDER_MAP_FILE, "r", encoding="utf-8") as f:
-                return json.load(f)
+        if catalog.version > snapshot_version():
+            write_snapshot(catalog.all(), catalog.version)
     except Exception as e:
-        print(f"WARN: failed to load gender map: {e}")
-    return {}
-
-def _save_gender_map(gmap: dict) -> None:
+        print(f"WARN: failed to write catalog snapshot file: {e}")
+
+def reload_catalog(db: Session, at_least: int = 0) -> None:
+    """Reload the whole catalog snapshot and rebuild the search index from it"""
+    catalog.load(db.query(Product).all(), at_least)
+    _build_catalog_indexes()
+    print(f"DEBUG: Catalog loaded with {len(catalog)} products (version {catalog.version})")
+    _save_catalog_file()
+
+def _refresh_product(db: Session, product_id: int, at_least: int = 0) -> None:
+    product = db.query(Product).filter(Product.id == product_id).first()
+    if product:
+        _index_product(catalog.refresh(product, at_least))
+        missing_products.discard(product_id)
+    else:
+        catalog.discard(product_id, at_least)
+        search_index.remove(product_id)
+        content_similarity.remove(product_id)
+        related_products.remove(product_id)
+        fragment_cache.discard(product_id)
+
+def _lookup_product(db: Session, product_id: int):
+    """
+    Catalog view for a product id, or None. Ids the snapshot has never seen only
+    reach the database when they are newer than every known product (another
+    worker may have just created them); misses are remembered briefly.
+    """
+    product = catalog.get(product_id)
+    if product is not None:
+        return product
+    if product_id <= catalog.max_id or product_id in missing_products:
+        return None
+    row = db.query(Product).filter(Product.id == product_id).first()
+    if row is None:
+        missing_products.add(product_id)
+        return None
+    product = catalog.refresh(row)
+    _index_product(product)
+    return product
+
+def _on_product_changed(db: Session, product_id: int) -> None:
+    """Propagate a committed product write to this worker's catalog and to the other workers"""
     try:
-        with open(GENDER_MAP_FILE, "w", encoding="utf-8") as f:
-            json.dump(gmap, f)
+        _refresh_product(db, product_id)
+        _save_catalog_file()
     except Exception as e:
-        print(f"WARN: failed to save gender map: {e}")
+        print(f"WARN: failed to refresh product {product_id}: {e}")
+    bus.publish(product_id, catalog.version)
+
+def apply_remote_change(event: dict) -> None:
+    """Invalidation bus handler: refresh a product another worker changed"""
+    if SessionLocal is None or not catalog.ready:
+        return
+    db = SessionLocal()
+    try:
+        product_id = event.get("product_id")
+        version = int(event.get("version") or 0)
+        if product_id is None:
+            reload_catalog(db, version)
+        else:
+            _refresh_product(db, int(product_id), version)
+            _save_catalog_file()
+    finally:
+        db.close()
 
 def save_uploaded_file(file: UploadFile) -> str:
     """Save uploaded file and return the file path"""
@@ -106,85 +198,232 @@ def save_uploaded_file(file: UploadFile) -> str:
         traceback.print_exc()
         raise e
 
+def _catalog_results(
+    db: Session,
+    search: Optional[str],
+    filters: dict,
+    after: Optional[str],
+    page_size: int,
+    with_facets: bool = False,
+    sort: Optional[str] = None,
+) -> dict:
+    """One keyset page of catalog results plus the cursor for the next page"""
+    ensure_catalog(db)
+    category = filters.get("category")
+
+    # Apply attribute filters first (bitmaps in the in-memory index)
+    allowed_ids = search_index.filter_ids(**filters)
+    cursor = decode_cursor(after)
+
+    page_ids = []
+    next_cursor = None
+    total_count = 0
+    # Which part of the search cascade answered, and how many products really matched
+    search_stage = None
+    match_count = 0
+    # Products the facet counts are computed over (None = whole catalog)
+    facet_base = None
+
+    if search and search.strip():
+        # Case-insensitive, partial matching across name, description, and category:
+        # every token, then typo-corrected tokens, then any token (see app.search_backends)
+        raw = search.strip()
+        backend = get_search_backend(db)
+        if sort in SORT_ORDERS:
+            # Explicit sort: page the sorted index over every match instead of by score
+            result = backend.search(db, raw, allowed_ids)
+            page_ids, next_cursor = keyset_slice(
+                search_index.sort_order(sort), cursor, page_size, set(result.ids).__contains__
+            )
+        else:
+            # Search cursors are (-score, id) so keys ascend like every other listing;
+            # a string key comes from a sorted listing and cannot resume a ranking
+            after_hit = None
+            if cursor and not isinstance(cursor[0], str):
+                after_hit = (-cursor[0], cursor[1])
+            result = backend.search(db, raw, allowed_ids, limit=page_size + 1, after=after_hit)
+            hits = result.hits
+            if len(hits) > page_size:
+                hits = hits[:page_size]
+                next_cursor = encode_cursor(-hits[-1][1], hits[-1][0])
+            page_ids = [pid for pid, _ in hits]
+        total_count = result.total
+        facet_base = IdBitmap.from_ids(result.matched_ids)
+        search_stage = result.stage
+        match_count = result.total
+
+        # If nothing matched, loosen to any product (closest related):
+        #    Prefer products in the same category if category was given, else the
+        #    products whose text is most alike, else recent ones. Only the category
+        #    listing pages; its cursors come back here because the search still matches nothing.
+        if not result.total:
+            if category:
+                fallback_ids = search_index.filter_ids(category=category)
+                page_ids, next_cursor = keyset_slice(
+                    search_index.sort_order(sort or "id"), cursor, page_size, fallback_ids.__contains__
+                )
+                total_count = len(fallback_ids)
+                facet_base = fallback_ids
+                search_stage = "fallback:category"
+            elif cursor is not None:
+                page_ids = []  # the similar/latest fallback is a single page, already shown
+            else:
+                page_ids = content_similarity.query(raw, page_size, allowed_ids)
+                search_stage = "fallback:similar"
+                if not page_ids:
+                    page_ids = search_index.all_ids()[-12:]
+                    search_stage = "fallback:latest"
+                total_count = len(page_ids)
+                facet_base = IdBitmap.from_ids(page_ids)
+    else:
+        # No search text: just list with filters
+        page_ids, next_cursor = keyset_slice(
+            search_index.sort_order(sort or "id"), cursor, page_size, allowed_ids.__contains__
+        )
+        total_count = len(allowed_ids)
+
+    products = catalog.many(page_ids)
+
+    return {
+        "products": products,
+        "next_cursor": next_cursor,
+        "total_count": total_count,
+        "facets": search_index.facet_counts(facet_base, **filters) if with_facets else {},
+        "price_histogram": search_index.price_histogram(facet_base, **filters) if with_facets else [],
+        "search_stage": search_stage,
+        "match_count": match_count,
+    }
+
+async def _cached_catalog_results(
+    search: Optional[str],
+    filters: dict,
+    after: Optional[str],
+    page_size: int,
+    with_facets: bool = False,
+    sort: Optional[str] = None,
+):
+    """
+    (results, catalog version) through the stale-while-revalidate query cache;
+    concurrent requests for the same query share one computation.
+    """
+    key = (
+        (search or "").strip().lower(), tuple(sorted(filters.items())),
+        after, page_size, with_facets, sort if sort in SORT_ORDERS else None,
+    )
+
+    def compute() -> dict:
+        # Runs in a worker thread and may outlive the request, so it gets its own session
+        db = SessionLocal()
+        try:
+            return _catalog_results(db, search, filters, after, page_size, with_facets, sort)
+        finally:
+            db.close()
+
+    results, version = await catalog_query_cache.get(key, catalog.version, compute)
+    if version != catalog.version:
+        # Stale while a refresh runs: keep its ids and order, but show current product data
+        results = dict(results, products=catalog.many(p.id for p in results["products"]))
+    return results, version
+
+def _record_search(search: Optional[str], product_ids: List[int]) -> None:
+    """Update analytics: increment search count for products shown for this search"""
+    if not search or not search.strip():
+        return
+    try:
+        _increment_search_counts(product_ids)
+        event_log.record("search", product_ids)
+    except Exception as e:
+        print(f"WARN: failed to increment search counts: {e}")
+
+def _parse_price(value: Optional[str]) -> Optional[float]:
+    """Price bound from a query string value; blank or invalid input means no bound"""
+    try:
+        price = float(value) if value not in (None, "") else None
+    except ValueError:
+        return None
+    return price if price is not None and price >= 0 else None
+
+def _catalog_filters(category, status, size, gender, min_price=None, max_price=None) -> dict:
+    """Non-empty catalog attribute and price filters"""
+    filters = {
+        "category": category, "status": status, "size": size, "gender": gender,
+        "min_price": _parse_price(min_price), "max_price": _parse_price(max_price),
+    }
+    return {field: value for field, value in filters.items() if value is not None and value != ""}
+
 @router.get("/", response_class=HTMLResponse)
 async def catalog_page(
     request: Request,
     search: Optional[str] = Query(None),
     category: Optional[str] = Query(None),
-    status: Optional[str] = Query(None)
+    status: Optional[str] = Query(None),
+    size: Optional[str] = Query(None),
+    gender: Optional[str] = Query(None),
+    min_price: Optional[str] = Query(None),
+    max_price: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None),
+    page_size: Optional[int] = Query(None),
+    after: Optional[str] = Query(None)
     , db: Session = Depends(get_db)
 ):
-    """Product catalog page with search and filters"""
+    """Product catalog page with search, filters, sorting and facet counts"""
     try:
-        from sqlalchemy import or_, and_
-        # Build SQLAlchemy query
-        base_query = db.query(Product)
-
-        # Apply exact filters first
-        if category:
-            base_query = base_query.filter(Product.category.ilike(f"%{category}%"))
-        if status:
-            base_query = base_query.filter(Product.status == status)
-
-        products = []
-
-        if search and search.strip():
-            # Case-insensitive, partial matching across name, description, and category
-            raw = search.strip()
-            tokens = [t for t in raw.replace("/", " ").replace("-", " ").split() if t]
-
-            # 1) Try full-string match across fields
-            full_cond = or_(
-                Product.name.ilike(f"%{raw}%"),
-                Product.description.ilike(f"%{raw}%"),
-                Product.category.ilike(f"%{raw}%")
-            )
-            query1 = base_query.filter(full_cond)
-            products = query1.order_by(Product.id).all()
-
-            # 2) If nothing, try token-wise OR across fields
-            if not products and tokens:
-                token_ors = []
-                for tok in tokens:
-                    token_ors.append(Product.name.ilike(f"%{tok}%"))
-                    token_ors.append(Product.description.ilike(f"%{tok}%"))
-                    token_ors.append(Product.category.ilike(f"%{tok}%"))
-                query2 = base_query.filter(or_(*token_ors))
-                products = query2.order_by(Product.id).all()
-
-            # 3) If still nothing, loosen to any product (closest related):
-            #    Prefer products in the same category if category was given, else recent ones
-            if not products:
-                if category:
-                    products = db.query(Product).filter(Product.category.ilike(f"%{category}%")).order_by(Product.id).all()
-                else:
-                    products = db.query(Product).order_by(Product.id.desc()).limit(12).all()
-
-            # Update analytics: increment search count for products shown for this search
-            try:
-                _increment_search_counts([p.id for p in products])
-            except Exception as e:
-                print(f"WARN: failed to increment search counts: {e}")
-        else:
-            # No search text: just list with filters
-            products = base_query.order_by(Product.id).all()
+        # Anonymous visitors get the rendered page for this query and catalog version
+        ensure_catalog(db)
+        cache_key = page_cache.key(request, catalog.version)
+        cached = page_cache.get(cache_key)
+        if cached is not None:
+            _record_search(search, list(cached.product_ids))
+            if cached.search_meta and not after:
+                query_log.record(search, cached.search_meta[1], cached.search_meta[0])
+            return page_cache.respond(request, cached)
+
+        page_size = clamp_page_size(page_size)
+        filters = _catalog_filters(category, status, size, gender, min_price, max_price)
+        results, results_version = await _cached_catalog_results(
+            search, filters, after, page_size, with_facets=True, sort=sort
+        )
+        products = results["products"]
+        facets = results["facets"]
+        _record_search(search, [p.id for p in products])
+        search_meta = ()
+        if results["search_stage"] is not None:
+            search_meta = (results["search_stage"], results["match_count"])
+            if not after:
+                # Later pages of the same search are not new queries
+                query_log.record(search, results["match_count"], results["search_stage"])
         
         # Debug: Print product information
         print(f"DEBUG: Found {len(products)} products in catalog")
         for p in products:
             print(f"DEBUG: Product ID: {p.id}, Name: {p.name}")
 
-        # Unique categories for filter dropdown
-        categories = [row[0] for row in db.query(Product.category).distinct().all() if row[0]]
+        # Categories for the filter dropdown come straight from the facet bitmaps
+        categories = [value for value, _ in facets.get("category", [])]
         
-        return templates.TemplateResponse("catalog.html", {
+        response = templates.TemplateResponse("catalog.html", {
             "request": request,
             "products": products,
             "categories": categories,
+            "facets": facets,
+            "price_histogram": results["price_histogram"],
+            "sort_orders": SORT_LABELS,
+            "total_count": results["total_count"],
+            "next_cursor": results["next_cursor"],
+            "page_size": page_size,
             "current_search": search,
             "current_category": category,
-            "current_status": status
+            "current_status": status,
+            "current_size": size,
+            "current_gender": gender,
+            "current_sort": sort if sort in SORT_ORDERS else "",
+            "current_min_price": filters.get("min_price"),
+            "current_max_price": filters.get("max_price")
         })
+        if results_version != catalog.version:
+            # Stale results served while a refresh runs; don't pin them under the new version
+            return response
+        return page_cache.store(request, cache_key, response, tuple(p.id for p in products), search_meta)
         
     except Exception as e:
         print(f"Error loading catalog: {e}")
@@ -195,6 +434,48 @@ async def catalog_page(
             "error": "Error loading products"
         })
 
+@router.get("/catalog/more", response_class=HTMLResponse)
+async def catalog_more(
+    request: Request,
+    search: Optional[str] = Query(None),
+    category: Optional[str] = Query(None),
+    status: Optional[str] = Query(None),
+    size: Optional[str] = Query(None),
+    gender: Optional[str] = Query(None),
+    min_price: Optional[str] = Query(None),
+    max_price: Optional[str] = Query(None),
+    sort: Optional[str] = Query(None),
+    page_size: Optional[int] = Query(None),
+    after: Optional[str] = Query(None),
+    db: Session = Depends(get_db)
+):
+    """Load-more fragment: the next page of product cards for the catalog grid"""
+    try:
+        page_size = clamp_page_size(page_size)
+        filters = _catalog_filters(category, status, size, gender, min_price, max_price)
+        ensure_catalog(db)
+        results, _ = await _cached_catalog_results(search, filters, after, page_size, sort=sort)
+        _record_search(search, [p.id for p in results["products"]])
+        response = templates.TemplateResponse("_product_cards.html", {
+            "request": request,
+            "products": results["products"]
+        })
+        response.headers["X-Next-Cursor"] = results["next_cursor"] or ""
+        return response
+    except Exception as e:
+        print(f"Error loading catalog page: {e}")
+        raise HTTPException(status_code=500, detail="Failed to load products")
+
+@router.get("/suggest")
+async def search_suggestions(
+    q: str = Query(""),
+    limit: int = Query(SUGGEST_LIMIT, ge=1, le=20),
+    db: Session = Depends(get_db)
+):
+    """Typeahead completions (product names and categories) for the search box"""
+    ensure_catalog(db)
+    return {"query": q, "suggestions": search_index.suggest(q, limit)}
+
 @router.get("/admin/analytics", response_class=HTMLResponse)
 async def admin_analytics(request: Request, db: Session = Depends(get_db)):
     """Admin analytics: top searched and favourited products"""
@@ -203,45 +484,36 @@ async def admin_analytics(request: Request, db: Session = Depends(get_db)):
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
 
     try:
-        # Load search counts
-        search_stats = _load_search_stats()  # {product_id(str): count}
-
-        # Favourite counts via aggregate
-        fav_counts = dict(
-            db.query(UserFavourite.product_id, func.count(UserFavourite.id))
-              .group_by(UserFavourite.product_id)
-              .all()
-        )
-
-        # Build combined rows for all products that have either metric
-        product_ids = set(int(pid) for pid in search_stats.keys()) | set(fav_counts.keys())
-        # Also include all products to show zeros for others (optional)
-        all_products = db.query(Product).all()
-        product_map = {p.id: p for p in all_products}
-        rows = []
-        for pid, product in product_map.items():
-            searches = int(search_stats.get(str(pid), 0))
-            favs = int(fav_counts.get(pid, 0))
-            rows.append({
-                "id": pid,
-                "name": product.name,
-                "searches": searches,
-                "favourites": favs
-            })
-
-        # Sort by searches desc, then favourites desc
-        rows.sort(key=lambda r: (r["searches"], r["favourites"]), reverse=True)
+        # Materialized per-product stats, read in index order (the last few seconds may still be buffered)
+        rows = [
+            {
+                "id": stat.product_id,
+                "name": name,
+                "searches": stat.searches,
+                "views": stat.views,
+                "favourites": stat.favourites,
+                "last_activity": stat.last_activity,
+            }
+            for stat, name in top_products(db, ANALYTICS_ROWS)
+        ]
 
         # Top 5 for chart
         top5 = rows[:5]
         chart_labels = [r["name"] for r in top5]
         chart_data = [r["searches"] for r in top5]
 
+        # Daily trend from the compacted event rollups (last 30 days)
+        trend = daily_totals(db)
+        # Top and zero-result queries from the heavy-hitter sketches
+        query_report = query_log.report()
+
         return templates.TemplateResponse("analytics.html", {
             "request": request,
             "rows": rows,
             "chart_labels": chart_labels,
-            "chart_data": chart_data
+            "chart_data": chart_data,
+            "trend": trend,
+            "query_report": query_report
         })
     except Exception as e:
         print(f"Error loading analytics: {e}")
@@ -249,44 +521,53 @@ async def admin_analytics(request: Request, db: Session = Depends(get_db)):
             "request": request,
             "rows": [],
             "chart_labels": [],
-            "chart_data": []
+            "chart_data": [],
+            "trend": [],
+            "query_report": {"top": [], "zero": []}
         })
 
 @router.get("/{product_id}", response_class=HTMLResponse)
 async def product_detail(product_id: int, request: Request, db: Session = Depends(get_db)):
     """Product detail page"""
     try:
-        # Debug: Print all product IDs
-        all_products = db.query(Product).all()
-        print(f"DEBUG: All products in database: {[p.id for p in all_products]}")
-        print(f"DEBUG: Looking for product ID: {product_id}")
-        
-        # Get product
-        product = db.query(Product).filter(Product.id == product_id).first()
-        
+        ensure_catalog(db)
+        # Unknown ids 404 straight from the catalog snapshot, before any other work
+        product = _lookup_product(db, product_id)
         if not product:
             print(f"DEBUG: Product with ID {product_id} not found")
             raise HTTPException(status_code=404, detail="Product not found")
-        
+        # In-memory only: counted for cached pages too, written behind by the stats flusher
+        view_counts.add([product.id])
+        event_log.record("view", [product.id])
+
+        # The page also shows recommendations, which change with favourites, not the catalog
+        cache_key = page_cache.key(request, (catalog.version, also_favourited.version))
+        cached = page_cache.get(cache_key)
+        if cached is not None:
+            return page_cache.respond(request, cached)
+
         print(f"DEBUG: Found product: {product.name} (ID: {product.id})")
         
-        # Get related products (same category, excluding current product)
-        related_products = db.query(Product).filter(
-            Product.category == product.category,
-            Product.id != product.id
-        ).limit(4).all()
+        # Related products are precomputed (same category, nearest price, shared sizes)
+        related = catalog.many(related_products.for_product(product.id))
         
-        print(f"DEBUG: Found {len(related_products)} related products")
+        print(f"DEBUG: Found {len(related)} related products")
+
+        also = catalog.many(also_favourited.for_product(product.id, 4))
         
-        return templates.TemplateResponse("product_detail.html", {
+        response = templates.TemplateResponse("product_detail.html", {
             "request": request,
             "product": product,
-            "related_products": related_products
+            "related_products": related,
+            "also_favourited": also
         })
+        return page_cache.store(request, cache_key, response)
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error loading product detail: {e}")
-        raise HTTPException(status_code=404, detail="Product not found")
+        raise HTTPException(status_code=500, detail="Failed to load product")
 
 @router.get("/debug/list", response_class=HTMLResponse)
 async def debug_products_list(request: Request, db: Session = Depends(get_db)):
@@ -338,17 +619,16 @@ async def admin_dashboard(
         return RedirectResponse(url="/auth/login", status_code=status.HTTP_302_FOUND)
     
     try:
-        # Build query with optional filters for admin view
-        query = db.query(Product)
+        # Apply the optional admin filters to the catalog snapshot (already in ID order)
+        ensure_catalog(db)
+        products = catalog.all()
         if search:
-            query = query.filter(Product.name.ilike(f"%{search}%"))
+            needle = search.lower()
+            products = [p for p in products if needle in p.name.lower()]
         if category:
-            query = query.filter(Product.category == category)
+            products = [p for p in products if p.category == category]
         if status:
-            query = query.filter(Product.status == status)
-
-        # Get products ordered by ID to maintain consistent positions
-        products = query.order_by(Product.id).all()
+            products = [p for p in products if p.status == status]
         
         # Get statistics
         total_products = len(products)
@@ -447,20 +727,15 @@ async def add_product(
             description=description,
             price=price,
             category=category,
+            gender=gender if gender in GENDERS else None,
             status=status,
             image_url=image_url,
-            images=json.dumps(uploaded_images) if uploaded_images else None,
-            sizes=json.dumps(sizes) if sizes else None
+            images=json.dumps(uploaded_images) if uploaded_images else None
         )
-        # Persist gender in external map (since DB lacks gender column)
-        try:
-            gmap = _load_gender_map()
-            gmap[str(product.id)] = gender
-            _save_gender_map(gmap)
-        except Exception as e:
-            print(f"WARN: could not persist gender map (add): {e}")
+        product.set_sizes(sizes)
         db.add(product)
         db.commit()
+        _on_product_changed(db, product.id)
         
         return RedirectResponse(url="/products/admin/dashboard", status_code=status.HTTP_302_FOUND)
         
@@ -551,16 +826,9 @@ async def edit_product(
         product.category = category
         product.status = product_status
         product.image_url = image_url
-        product.sizes = json.dumps(sizes) if sizes else None
-        # Persist gender tag inside description (temporary until DB column is added)
-        if gender in ("Male", "Female"):
-            # remove existing gender tag
-            if product.description:
-                product.description = product.description.replace("Gender: Male", "").replace("Gender: Female", "").strip()
-            if product.description:
-                product.description = f"{product.description}\nGender: {gender}".strip()
-            else:
-                product.description = f"Gender: {gender}"
+        product.set_sizes(sizes)
+        if gender in GENDERS:
+            product.gender = gender
         
         # Handle image removal first
         if images_to_remove:
@@ -611,6 +879,7 @@ async def edit_product(
             product.images = json.dumps(existing_images + uploaded_images)
 
         db.commit()
+        _on_product_changed(db, product_id)
         
         return RedirectResponse(url="/products/admin/dashboard", status_code=status.HTTP_302_FOUND)
         
@@ -648,6 +917,7 @@ async def remove_product_image(product_id: int, request: Request, image_path: st
             current_images.remove(image_path)
             product.images = json.dumps(current_images) if current_images else None
             db.commit()
+            _on_product_changed(db, product_id)
             
             print(f"DEBUG: Image removed successfully. Remaining images: {len(current_images)}")
             
@@ -687,6 +957,7 @@ async def delete_product(product_id: int, request: Request, db: Session = Depend
         # Delete product
         db.delete(product)
         db.commit()
+        _on_product_changed(db, product_id)
         
         return {"message": "Product deleted successfully"}
         
@@ -712,6 +983,7 @@ async def update_product_status(product_id: int, request: Request, status: str =
         # Update status
         product.status = status
         db.commit()
+        _on_product_changed(db, product_id)
         
         return RedirectResponse(url="/products/admin/dashboard", status_code=status.HTTP_302_FOUND)
         
@@ -0,0 +1,196 @@
+"""
+Idempotent schema upgrades for databases created before the current models.
+
+Base.metadata.create_all only creates missing tables; the steps here add the
+indexes, columns and backfills that existing databases need. They are safe to
+run repeatedly and are invoked by init_schema.py.
+"""
+import json
+import os
+
+from sqlalchemy import inspect, text
+from sqlalchemy.orm import sessionmaker
+
+from app.models import GENDERS, Product, ProductSize, ProductStat, split_sizes
+from app.product_stats import refresh_favourite_counts, upsert_counts
+from app.search_backends import install_fulltext
+
+# Written by older versions of the admin add route
+LEGACY_GENDER_MAP_FILE = os.path.join("analytics", "gender_map.json")
+# Search counts rewritten on every search by older versions; now kept in product_stats
+LEGACY_SEARCH_STATS_FILE = os.path.join("analytics", "search_stats.json")
+# Created by earlier versions, but no query uses them
+OBSOLETE_INDEXES = {
+    "product_stats": ["ix_product_stats_favourites", "ix_product_stats_views", "ix_product_stats_last_activity"],
+}
+
+
+def add_missing_columns(engine, table, columns) -> None:
+    """ALTER TABLE ADD COLUMN for model columns the existing table lacks"""
+    existing = {col["name"] for col in inspect(engine).get_columns(table.name)}
+    with engine.begin() as conn:
+        for name in columns:
+            if name not in existing:
+                column = table.c[name]
+                column_type = column.type.compile(dialect=engine.dialect)
+                definition = f"{name} {column_type}"
+                if column.server_default is not None:
+                    # Existing rows need a value for NOT NULL counters
+                    definition += f" DEFAULT {column.server_default.arg}"
+                    if not column.nullable:
+                        definition += " NOT NULL"
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {definition}"))
+                print(f"✅ Added column {table.name}.{name}.")
+
+
+def drop_obsolete_indexes(engine) -> None:
+    """Drop indexes listed in OBSOLETE_INDEXES that still exist"""
+    inspector = inspect(engine)
+    tables = set(inspector.get_table_names())
+    with engine.begin() as conn:
+        for table, names in OBSOLETE_INDEXES.items():
+            if table not in tables:
+                continue
+            existing = {index["name"] for index in inspector.get_indexes(table)}
+            for name in names:
+                if name in existing:
+                    suffix = f" ON {table}" if engine.dialect.name == "mysql" else ""
+                    conn.execute(text(f"DROP INDEX {name}{suffix}"))
+                    print(f"✅ Dropped unused index {name}.")
+
+
+def ensure_size_index(engine) -> None:
+    """(size, product_id) index on product_sizes"""
+    for index in ProductSize.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+
+
+def backfill_product_sizes(engine) -> int:
+    """Copy sizes from the legacy Product.sizes JSON column into product_sizes"""
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    created = 0
+    try:
+        for product in db.query(Product).filter(Product.sizes.isnot(None)).all():
+            try:
+                legacy = json.loads(product.sizes)
+            except (json.JSONDecodeError, TypeError):
+                legacy = []
+            if not isinstance(legacy, list):
+                legacy = []
+            existing = {row.size for row in product.size_rows}
+            for size in split_sizes(legacy):
+                if size not in existing:
+                    product.size_rows.append(ProductSize(size=size, stock_quantity=1))
+                    created += 1
+        db.commit()
+    finally:
+        db.close()
+    return created
+
+
+def _strip_gender_tags(description):
+    if not description:
+        return description
+    for gender in GENDERS:
+        description = description.replace(f"Gender: {gender}", "")
+    return description.strip() or None
+
+
+def backfill_gender(engine) -> int:
+    """Move "Gender: X" description tags (and the old gender map) into Product.gender"""
+    gender_map = {}
+    try:
+        if os.path.exists(LEGACY_GENDER_MAP_FILE):
+            with open(LEGACY_GENDER_MAP_FILE, "r", encoding="utf-8") as f:
+                gender_map = json.load(f)
+    except Exception as e:
+        print(f"WARN: failed to read legacy gender map: {e}")
+
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    updated = 0
+    try:
+        for product in db.query(Product).all():
+            description = product.description or ""
+            tagged = next((g for g in GENDERS if f"Gender: {g}" in description), None)
+            # The add route wrote the map before the product had an id, so most keys are "None"
+            mapped = gender_map.get(str(product.id))
+            gender = product.gender or tagged or (mapped if mapped in GENDERS else None)
+            cleaned = _strip_gender_tags(product.description)
+            if gender != product.gender or cleaned != product.description:
+                product.gender = gender
+                product.description = cleaned
+                updated += 1
+        db.commit()
+    finally:
+        db.close()
+    return updated
+
+
+def migrate_search_stats(engine) -> int:
+    """
+    Add the legacy search_stats.json counts to product_stats. The file is renamed
+    afterwards so a second run does not count them twice.
+    """
+    if not os.path.exists(LEGACY_SEARCH_STATS_FILE):
+        return 0
+    try:
+        with open(LEGACY_SEARCH_STATS_FILE, "r", encoding="utf-8") as f:
+            legacy = json.load(f)
+    except Exception as e:
+        print(f"WARN: failed to read legacy search stats: {e}")
+        return 0
+    counts = {}
+    for key, count in (legacy if isinstance(legacy, dict) else {}).items():
+        try:
+            counts[int(key)] = int(count)
+        except (TypeError, ValueError):
+            continue
+
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    try:
+        if counts:
+            upsert_counts(db, "searches", counts)
+        db.commit()
+    finally:
+        db.close()
+    os.replace(LEGACY_SEARCH_STATS_FILE, LEGACY_SEARCH_STATS_FILE + ".migrated")
+    return len(counts)
+
+
+def upgrade_schema(engine) -> None:
+    """Run every upgrade step against the given engine"""
+    add_missing_columns(engine, Product.__table__, ["gender"])
+    for index in Product.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    updated = backfill_gender(engine)
+    print(f"✅ Product gender backfilled ({updated} products updated).")
+
+    ensure_size_index(engine)
+    created = backfill_product_sizes(engine)
+    print(f"✅ product_sizes backfilled ({created} new rows).")
+
+    # Materialized analytics: counters added after the table was first created
+    add_missing_columns(engine, ProductStat.__table__, ["views", "favourites", "last_activity"])
+    for index in ProductStat.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
+    drop_obsolete_indexes(engine)
+    migrated = migrate_search_stats(engine)
+    print(f"✅ Search stats migrated to product_stats ({migrated} products).")
+    Session = sessionmaker(bind=engine)
+    db = Session()
+    try:
+        # Workers keep favourites current incrementally; this corrects any drift
+        refresh_favourite_counts(db)
+        db.commit()
+    finally:
+        db.close()
+    print("✅ product_stats favourite counts refreshed.")
+
+    # Full-text search column/table used when SEARCH_BACKEND=database
+    try:
+        install_fulltext(engine)
+    except Exception as e:
+        print(f"WARN: full-text search not installed: {e}")
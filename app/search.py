@@ -0,0 +1,674 @@
+"""
+In-process search index for the product catalog.
+
+The index is built once at startup from the products table and kept up to
+date by the admin write routes, so catalog searches, attribute filters and
+facet counts are answered from memory instead of ILIKE scans and GROUP BYs.
+"""
+import heapq
+import math
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Attributes kept as per-value bitmaps for filtering and facet counts
+FACET_FIELDS = ("category", "status", "size", "gender")
+
+# Listing orders served from presorted (sort_key, id) arrays
+SORT_ORDERS = ("id", "newest", "price_asc", "price_desc", "name")
+PRICE_BUCKETS = 6
+
+# Typeahead: completions returned per prefix by default
+SUGGEST_LIMIT = 8
+
+# Fuzzy matching: shortest token worth correcting and edit budget by length
+FUZZY_MIN_LENGTH = 3
+FUZZY_MAX_DISTANCE = 2
+
+# BM25F relevance: per-field weights and the usual saturation/length parameters
+FIELD_WEIGHTS = {"name": 3.0, "category": 2.0, "description": 1.0}
+BM25_K1 = 1.2
+BM25_B = 0.75
+# Score multipliers for query tokens that only match part of a term or a typo correction
+PARTIAL_MATCH_WEIGHT = 0.7
+FUZZY_MATCH_WEIGHT = 0.5
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Split text into lowercase alphanumeric tokens"""
+    if not text:
+        return []
+    return TOKEN_RE.findall(text.lower())
+
+
+class IdBitmap:
+    """Set of product ids stored as the bits of a Python int (bit n set = id n present)"""
+    __slots__ = ("bits", "_ids")
+
+    def __init__(self, bits: int = 0):
+        self.bits = bits
+        self._ids: Optional[Set[int]] = None
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int]) -> "IdBitmap":
+        ids = list(ids)
+        if not ids:
+            return cls()
+        buf = bytearray(max(ids) // 8 + 1)
+        for pid in ids:
+            buf[pid >> 3] |= 1 << (pid & 7)
+        return cls(int.from_bytes(buf, "little"))
+
+    def ids(self) -> Set[int]:
+        """The ids as a set (computed once)"""
+        if self._ids is None:
+            ones = bin(self.bits)[:1:-1]  # least significant bit first
+            ids = set()
+            pos = ones.find("1")
+            while pos != -1:
+                ids.add(pos)
+                pos = ones.find("1", pos + 1)
+            self._ids = ids
+        return self._ids
+
+    def __contains__(self, pid) -> bool:
+        return pid in self.ids()
+
+    def __iter__(self):
+        return iter(sorted(self.ids()))
+
+    def __len__(self) -> int:
+        return self.bits.bit_count()
+
+    def __bool__(self) -> bool:
+        return self.bits != 0
+
+    def __and__(self, other):
+        if isinstance(other, IdBitmap):
+            return IdBitmap(self.bits & other.bits)
+        return {pid for pid in other if pid in self}
+
+    __rand__ = __and__
+
+    def __or__(self, other: "IdBitmap") -> "IdBitmap":
+        return IdBitmap(self.bits | other.bits)
+
+
+def edit_distance(a: str, b: str, limit: int) -> int:
+    """Optimal string alignment distance, or limit + 1 once it exceeds limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    prev2: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        cur = [i] + [0] * len(b)
+        row_min = cur[0]
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                cur[j] = min(cur[j], prev2[j - 2] + 1)
+            row_min = min(row_min, cur[j])
+        if row_min > limit:
+            return limit + 1
+        prev2, prev = prev, cur
+    return prev[len(b)]
+
+
+def _deletes(term: str, distance: int) -> Set[str]:
+    """All strings reachable from term by removing up to `distance` characters"""
+    result = {term}
+    frontier = {term}
+    for _ in range(distance):
+        next_frontier = set()
+        for word in frontier:
+            if len(word) <= 1:
+                continue
+            for i in range(len(word)):
+                next_frontier.add(word[:i] + word[i + 1:])
+        result |= next_frontier
+        frontier = next_frontier
+    return result
+
+
+def _max_distance(term: str) -> int:
+    return 1 if len(term) <= 5 else FUZZY_MAX_DISTANCE
+
+
+class FuzzyTermIndex:
+    """SymSpell-style delete index over a vocabulary of terms"""
+
+    def __init__(self, term_counts: Dict[str, int]):
+        self._counts = term_counts
+        self._deletes: Dict[str, List[str]] = {}
+        for term in term_counts:
+            if len(term) < FUZZY_MIN_LENGTH:
+                continue
+            for variant in _deletes(term, _max_distance(term)):
+                self._deletes.setdefault(variant, []).append(term)
+
+    def lookup(self, token: str, limit: int = 3) -> List[Tuple[str, int]]:
+        """Closest vocabulary terms as (term, distance), best first"""
+        if len(token) < FUZZY_MIN_LENGTH:
+            return []
+        max_distance = _max_distance(token)
+        candidates: Set[str] = set()
+        for variant in _deletes(token, max_distance):
+            candidates.update(self._deletes.get(variant, ()))
+
+        matches = []
+        for term in candidates:
+            distance = edit_distance(token, term, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, -self._counts.get(term, 0), term))
+        matches.sort()
+        return [(term, distance) for distance, _, term in matches[:limit]]
+
+
+class ProductSearchIndex:
+    """Inverted index of product tokens plus category and status lookups"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Set[int]] = {}
+        self._doc_terms: Dict[int, Set[str]] = {}
+        # Per-field term frequencies and lengths for BM25F scoring
+        self._field_tf: Dict[int, Dict[str, Counter]] = {}
+        self._field_len_total: Counter = Counter()
+        # Name/category terms (the vocabulary typos are corrected against)
+        self._fuzzy_counts: Dict[str, int] = {}
+        self._doc_fuzzy_terms: Dict[int, Set[str]] = {}
+        self._fuzzy: Optional[FuzzyTermIndex] = None
+        # field -> value -> bitmap of product ids, and each product's values for removal
+        self._facets: Dict[str, Dict[str, int]] = {f: {} for f in FACET_FIELDS}
+        self._doc_attrs: Dict[int, Dict[str, Tuple[str, ...]]] = {}
+        self._all_bits = 0
+        # Sorted (suffix, term) pairs so substring lookups keep ILIKE '%tok%' semantics
+        self._suffixes: Optional[List[Tuple[str, str]]] = None
+        # Sort keys per product and the presorted (sort_key, id) arrays built from them
+        self._prices: Dict[int, float] = {}
+        self._names: Dict[int, str] = {}
+        self._orders: Dict[str, List[Tuple]] = {}
+        # Price histogram buckets as (low, high, highest price in it, bitmap), rebuilt after writes
+        self._price_buckets: Optional[List[Tuple[float, float, Optional[float], int]]] = None
+        # Display name/category per product, search counts, and the sorted completion table
+        self._labels: Dict[int, Tuple[str, str]] = {}
+        self._popularity: Dict[int, int] = {}
+        self._completions: Optional[Tuple[List[Tuple[str, int]], List[dict]]] = None
+        # Bumped by every write, so a completion table built outside the lock can tell it is stale
+        self._generation = 0
+        self.ready = False
+
+    def build(self, products: Iterable) -> None:
+        """Rebuild the whole index from an iterable of products"""
+        with self._lock:
+            self._postings = {}
+            self._doc_terms = {}
+            self._field_tf = {}
+            self._field_len_total = Counter()
+            self._fuzzy_counts = {}
+            self._doc_fuzzy_terms = {}
+            self._facets = {f: {} for f in FACET_FIELDS}
+            self._doc_attrs = {}
+            self._all_bits = 0
+            self._prices = {}
+            self._names = {}
+            self._labels = {}
+            for product in products:
+                self._add(product)
+            self._invalidate_lookups()
+            self.ready = True
+
+    def upsert(self, product) -> None:
+        """Add a product or replace its previous entry"""
+        with self._lock:
+            self._remove(product.id)
+            self._add(product)
+            self._invalidate_lookups()
+
+    def remove(self, product_id: int) -> None:
+        """Drop a product from the index"""
+        with self._lock:
+            self._remove(product_id)
+            self._invalidate_lookups()
+
+    def _invalidate_lookups(self) -> None:
+        self._suffixes = None
+        self._fuzzy = None
+        self._orders = {}
+        self._price_buckets = None
+        self._completions = None
+        self._generation += 1
+
+    def _add(self, product) -> None:
+        fields = {
+            "name": Counter(tokenize(product.name)),
+            "category": Counter(tokenize(product.category)),
+            "description": Counter(tokenize(product.description)),
+        }
+        fuzzy_terms = set(fields["name"]) | set(fields["category"])
+        terms = fuzzy_terms | set(fields["description"])
+        for term in terms:
+            self._postings.setdefault(term, set()).add(product.id)
+        self._doc_terms[product.id] = terms
+        self._field_tf[product.id] = fields
+        for field, counts in fields.items():
+            self._field_len_total[field] += sum(counts.values())
+        for term in fuzzy_terms:
+            self._fuzzy_counts[term] = self._fuzzy_counts.get(term, 0) + 1
+        self._doc_fuzzy_terms[product.id] = fuzzy_terms
+
+        attrs = {
+            "category": (product.category,) if product.category else (),
+            "status": (product.status,) if product.status else (),
+            "size": tuple(product.get_sizes_list()),
+            "gender": (product.gender,) if product.gender else (),
+        }
+        bit = 1 << product.id
+        for field, values in attrs.items():
+            table = self._facets[field]
+            for value in values:
+                table[value] = table.get(value, 0) | bit
+        self._doc_attrs[product.id] = attrs
+        self._all_bits |= bit
+        self._prices[product.id] = float(product.price or 0)
+        self._names[product.id] = (product.name or "").lower()
+        self._labels[product.id] = (" ".join((product.name or "").split()), product.category or "")
+
+    def _remove(self, product_id: int) -> None:
+        for term in self._doc_terms.pop(product_id, ()):
+            ids = self._postings.get(term)
+            if ids is not None:
+                ids.discard(product_id)
+                if not ids:
+                    del self._postings[term]
+        for field, counts in self._field_tf.pop(product_id, {}).items():
+            self._field_len_total[field] -= sum(counts.values())
+        for term in self._doc_fuzzy_terms.pop(product_id, ()):
+            count = self._fuzzy_counts.get(term, 0) - 1
+            if count > 0:
+                self._fuzzy_counts[term] = count
+            else:
+                self._fuzzy_counts.pop(term, None)
+
+        attrs = self._doc_attrs.pop(product_id, None)
+        if attrs:
+            mask = ~(1 << product_id)
+            for field, values in attrs.items():
+                table = self._facets[field]
+                for value in values:
+                    bits = table.get(value, 0) & mask
+                    if bits:
+                        table[value] = bits
+                    else:
+                        table.pop(value, None)
+            self._all_bits &= mask
+        self._prices.pop(product_id, None)
+        self._names.pop(product_id, None)
+        self._labels.pop(product_id, None)
+
+    def _suffix_table(self) -> List[Tuple[str, str]]:
+        if self._suffixes is None:
+            self._suffixes = sorted(
+                (term[i:], term) for term in self._postings for i in range(len(term))
+            )
+        return self._suffixes
+
+    def matching_terms(self, fragment: str) -> Set[str]:
+        """Indexed terms containing the fragment as a substring"""
+        with self._lock:
+            table = self._suffix_table()
+            terms = set()
+            pos = bisect_left(table, (fragment, ""))
+            while pos < len(table) and table[pos][0].startswith(fragment):
+                terms.add(table[pos][1])
+                pos += 1
+            return terms
+
+    def term_ids(self, fragment: str) -> Set[int]:
+        """Product ids having a token that contains the fragment"""
+        with self._lock:
+            ids: Set[int] = set()
+            for term in self.matching_terms(fragment):
+                ids |= self._postings.get(term, set())
+            return ids
+
+    def corrections(self, token: str) -> List[Tuple[str, int]]:
+        """Name/category terms within a small edit distance of the token, best first"""
+        with self._lock:
+            if self._fuzzy is None:
+                self._fuzzy = FuzzyTermIndex(dict(self._fuzzy_counts))
+            return self._fuzzy.lookup(token)
+
+    def fuzzy_term_ids(self, token: str) -> Set[int]:
+        """Product ids for a token, falling back to typo corrections when it has no hits"""
+        with self._lock:
+            ids = self.term_ids(token)
+            if ids:
+                return ids
+            for term, _ in self.corrections(token):
+                ids |= self._postings.get(term, set())
+            return ids
+
+    def search(self, text: str, match_all: bool = True, fuzzy: bool = False) -> Set[int]:
+        """Product ids matching all (or any) tokens of the text, optionally typo-tolerant"""
+        tokens = tokenize(text)
+        if not tokens:
+            return set()
+        with self._lock:
+            result: Optional[Set[int]] = None
+            for token in tokens:
+                ids = self.fuzzy_term_ids(token) if fuzzy else self.term_ids(token)
+                if result is None:
+                    result = set(ids)
+                elif match_all:
+                    result &= ids
+                else:
+                    result |= ids
+                if match_all and not result:
+                    break
+            return result or set()
+
+    def _expansions(self, token: str) -> Dict[str, float]:
+        """Indexed terms a query token stands for, with their match weight"""
+        terms = {
+            term: 1.0 if term == token else PARTIAL_MATCH_WEIGHT
+            for term in self.matching_terms(token)
+        }
+        if not terms:
+            for term, distance in self.corrections(token):
+                terms[term] = FUZZY_MATCH_WEIGHT / distance
+        return terms
+
+    def _bm25f(self, product_id: int, term: str, avg_len: Dict[str, float]) -> float:
+        fields = self._field_tf[product_id]
+        tf = 0.0
+        for field, weight in FIELD_WEIGHTS.items():
+            counts = fields[field]
+            freq = counts.get(term, 0)
+            if freq:
+                norm = 1 - BM25_B + BM25_B * sum(counts.values()) / avg_len[field]
+                tf += weight * freq / norm
+        return tf * (BM25_K1 + 1) / (BM25_K1 + tf)
+
+    def rank(
+        self,
+        text: str,
+        candidate_ids: Iterable[int],
+        limit: Optional[int] = None,
+        after: Optional[Tuple[float, int]] = None,
+    ) -> List[Tuple[int, float]]:
+        """
+        Score candidates against the text with BM25F; best (product_id, score) first.
+        `after` is the (score, product_id) of the last hit already shown.
+        """
+        candidates = set(candidate_ids)
+        with self._lock:
+            total = len(self._doc_attrs) or 1
+            avg_len = {
+                field: (self._field_len_total[field] / total) or 1.0
+                for field in FIELD_WEIGHTS
+            }
+            scores: Dict[int, float] = {}
+            for token in dict.fromkeys(tokenize(text)):
+                # A token counts once per product, through its best-scoring expansion
+                best: Dict[int, float] = {}
+                for term, weight in self._expansions(token).items():
+                    postings = self._postings.get(term, set())
+                    df = len(postings)
+                    idf = math.log(1 + (total - df + 0.5) / (df + 0.5))
+                    for pid in postings & candidates:
+                        score = weight * idf * self._bm25f(pid, term, avg_len)
+                        if score > best.get(pid, 0.0):
+                            best[pid] = score
+                for pid, score in best.items():
+                    scores[pid] = scores.get(pid, 0.0) + score
+
+            key = lambda pid: (scores.get(pid, 0.0), -pid)
+            if after is not None:
+                boundary = (after[0], -after[1])
+                candidates = {pid for pid in candidates if key(pid) < boundary}
+            if limit is None:
+                top = sorted(candidates, key=key, reverse=True)
+            else:
+                top = heapq.nlargest(limit, candidates, key=key)
+            return [(pid, scores.get(pid, 0.0)) for pid in top]
+
+    def _filter_bits(
+        self,
+        category: Optional[str] = None,
+        status: Optional[str] = None,
+        size: Optional[str] = None,
+        gender: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> Dict[str, int]:
+        """Bitmap for each active filter: category by substring, price by range, the rest exact"""
+        active: Dict[str, int] = {}
+        if min_price is not None or max_price is not None:
+            active["price"] = self._price_range_bits(min_price, max_price)
+        if category:
+            needle = category.lower()
+            bits = 0
+            for value, value_bits in self._facets["category"].items():
+                if needle in value.lower():
+                    bits |= value_bits
+            active["category"] = bits
+        for field, value in (("status", status), ("size", size), ("gender", gender)):
+            if value:
+                active[field] = self._facets[field].get(value, 0)
+        return active
+
+    def filter_ids(
+        self,
+        category: Optional[str] = None,
+        status: Optional[str] = None,
+        size: Optional[str] = None,
+        gender: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> IdBitmap:
+        """Product ids passing every given filter"""
+        with self._lock:
+            bits = self._all_bits
+            active = self._filter_bits(category, status, size, gender, min_price, max_price)
+            for filter_bits in active.values():
+                bits &= filter_bits
+            return IdBitmap(bits)
+
+    def facet_counts(
+        self,
+        matched: Optional[IdBitmap] = None,
+        category: Optional[str] = None,
+        status: Optional[str] = None,
+        size: Optional[str] = None,
+        gender: Optional[str] = None,
+        min_price: Optional[float] = None,
+        max_price: Optional[float] = None,
+    ) -> Dict[str, List[Tuple[str, int]]]:
+        """
+        Per-value counts for every facet field within the matched products.
+        Each field is counted with the other filters applied but not its own, so
+        selecting "Boots" still shows how many results the other categories have.
+        """
+        with self._lock:
+            base = self._all_bits if matched is None else matched.bits & self._all_bits
+            active = self._filter_bits(category, status, size, gender, min_price, max_price)
+            facets: Dict[str, List[Tuple[str, int]]] = {}
+            for field in FACET_FIELDS:
+                bits = base
+                for other, filter_bits in active.items():
+                    if other != field:
+                        bits &= filter_bits
+                counts = [
+                    (value, (bits & value_bits).bit_count())
+                    for value, value_bits in self._facets[field].items()
+                ]
+                facets[field] = sorted(counts, key=_facet_sort_key(field))
+            return facets
+
+    def price_histogram(self, matched: Optional[IdBitmap] = None, **filters) -> List[dict]:
+        """
+        Product counts per precomputed price bucket within the matched products,
+        with every filter except the price range itself applied. "max" is the
+        highest price in the bucket (None when empty), so min_price=low and
+        max_price=max select exactly the bucket's products.
+        """
+        with self._lock:
+            bits = self._all_bits if matched is None else matched.bits & self._all_bits
+            for field, filter_bits in self._filter_bits(**filters).items():
+                if field != "price":
+                    bits &= filter_bits
+            return [
+                {"low": low, "high": high, "max": top, "count": (bits & bucket_bits).bit_count()}
+                for low, high, top, bucket_bits in self._histogram_buckets()
+            ]
+
+    def _price_range_bits(self, min_price: Optional[float], max_price: Optional[float]) -> int:
+        # Both bounds are inclusive
+        order = self.sort_order("price_asc")
+        start = 0 if min_price is None else bisect_left(order, (min_price, -1))
+        end = len(order) if max_price is None else bisect_right(order, (max_price, float("inf")))
+        return IdBitmap.from_ids(pid for _, pid in order[start:end]).bits
+
+    def _histogram_buckets(self) -> List[Tuple[float, float, Optional[float], int]]:
+        if self._price_buckets is None:
+            buckets = []
+            if self._prices:
+                low = math.floor(min(self._prices.values()))
+                high = math.ceil(max(self._prices.values()))
+                width = _nice_width((high - low) / PRICE_BUCKETS)
+                low = math.floor(low / width) * width
+                # Enough buckets to reach the max, at least one; no extra bucket when it sits on an edge
+                count = max(1, math.ceil((high - low) / width))
+                members: List[List[Tuple[float, int]]] = [[] for _ in range(count)]
+                for pid, price in self._prices.items():
+                    # [low, high) per bucket, except that the last one also takes the max
+                    members[min(int((price - low) // width), count - 1)].append((price, pid))
+                for i, bucket in enumerate(members):
+                    top = max(price for price, _ in bucket) if bucket else None
+                    buckets.append((low + i * width, low + (i + 1) * width, top,
+                                    IdBitmap.from_ids(pid for _, pid in bucket).bits))
+            self._price_buckets = buckets
+        return self._price_buckets
+
+    def set_popularity(self, counts: Dict[int, int]) -> None:
+        """
+        Replace the per-product search counts that weight typeahead completions.
+        Unchanged counts are a no-op; otherwise the completion table is rebuilt
+        in the calling thread (the stats flusher) and swapped in, so suggest()
+        never pays for the rebuild.
+        """
+        counts = dict(counts)
+        with self._lock:
+            if counts == self._popularity:
+                return
+            labels, generation = dict(self._labels), self._generation
+        table = _build_completions(labels, counts)
+        with self._lock:
+            self._popularity = counts
+            # A product written meanwhile makes the table stale; suggest() rebuilds it then
+            self._completions = table if generation == self._generation else None
+
+    def _completion_table(self) -> Tuple[List[Tuple[str, int]], List[dict]]:
+        if self._completions is None:
+            self._completions = _build_completions(self._labels, self._popularity)
+        return self._completions
+
+    def suggest(self, prefix: str, limit: int = SUGGEST_LIMIT) -> List[dict]:
+        """Top name and category completions for a typed prefix, most searched first"""
+        prefix = " ".join((prefix or "").lower().split())
+        if not prefix or limit < 1:
+            return []
+        with self._lock:
+            keys, entries = self._completion_table()
+            matched = set()
+            for pos in range(bisect_left(keys, (prefix,)), len(keys)):
+                key, entry = keys[pos]
+                if not key.startswith(prefix):
+                    break
+                matched.add(entry)
+            best = heapq.nsmallest(
+                limit,
+                matched,
+                # Completions of the whole text beat mid-phrase matches of equal weight
+                key=lambda entry: (
+                    -entries[entry]["weight"],
+                    not entries[entry]["text"].lower().startswith(prefix),
+                    entries[entry]["text"],
+                ),
+            )
+            return [dict(entries[entry]) for entry in best]
+
+    def all_ids(self) -> List[int]:
+        """All indexed product ids in ascending order"""
+        return [pid for _, pid in self.sort_order("id")]
+
+    def sort_order(self, sort: str = "id") -> List[Tuple]:
+        """Ascending (sort_key, id) pairs for one of SORT_ORDERS"""
+        if sort not in SORT_ORDERS:
+            sort = "id"
+        with self._lock:
+            order = self._orders.get(sort)
+            if order is None:
+                if sort == "newest":
+                    order = [(-pid, pid) for pid in self._prices]
+                elif sort == "price_asc":
+                    order = [(price, pid) for pid, price in self._prices.items()]
+                elif sort == "price_desc":
+                    order = [(-price, pid) for pid, price in self._prices.items()]
+                elif sort == "name":
+                    order = [(name, pid) for pid, name in self._names.items()]
+                else:
+                    order = [(pid, pid) for pid in self._prices]
+                order.sort()
+                self._orders[sort] = order
+            return order
+
+
+def _build_completions(labels: Dict[int, Tuple[str, str]],
+                       popularity: Dict[int, int]) -> Tuple[List[Tuple[str, int]], List[dict]]:
+    """Sorted (word-start key, entry index) pairs and the entries they point to"""
+    # One entry per distinct name or category, weighted by its products' search counts
+    weights: Dict[Tuple[str, str], int] = {}
+    for pid, (name, category) in labels.items():
+        weight = 1 + popularity.get(pid, 0)
+        for kind, value in (("name", name), ("category", category)):
+            if value:
+                weights[(kind, value)] = weights.get((kind, value), 0) + weight
+    entries = []
+    keys = []
+    for (kind, value), weight in weights.items():
+        words = value.lower().split()
+        # Every word start is a key, so "max" completes "Air Max 90"
+        for start in range(len(words)):
+            keys.append((" ".join(words[start:]), len(entries)))
+        entries.append({"text": value, "type": kind, "weight": weight})
+    keys.sort()
+    return keys, entries
+
+
+def _nice_width(raw: float) -> float:
+    """Round a bucket width up to 1, 2 or 5 times a power of ten"""
+    if raw <= 0:
+        return 1.0
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for step in (1, 2, 5, 10):
+        if raw <= step * magnitude:
+            return float(step * magnitude)
+    return float(10 * magnitude)
+
+
+def _facet_sort_key(field: str):
+    if field == "size":
+        # Numeric sizes in numeric order, anything else (S, M, L...) after them
+        return lambda item: (0, float(item[0]), "") if item[0].replace(".", "", 1).isdigit() else (1, 0.0, item[0])
+    return lambda item: (-item[1], item[0])
+
+
+# Shared index used by the products router
+search_index = ProductSearchIndex()
@@ -0,0 +1,262 @@
+"""
+Pluggable text-search backends for the product catalog.
+
+Every backend answers the same question - which of the allowed products match
+this text, best first - and returns a SearchResult, so the in-memory index and
+the database full-text engines can be swapped (and benchmarked) freely.
+
+  memory    in-process inverted index (app.search), the default
+  database  Postgres tsvector column + GIN index, or an SQLite FTS5 table
+
+Select one with the SEARCH_BACKEND environment variable. The database tables,
+columns and triggers are created by init_schema.py (see install_* below).
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Container, List, Optional, Set, Tuple
+
+from sqlalchemy import text as sql_text
+from sqlalchemy.orm import Session
+
+from app.search import search_index, tokenize
+
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "memory").lower()
+
+# Weights for name, category and description, mirroring app.search.FIELD_WEIGHTS
+FTS_FIELD_WEIGHTS = (3.0, 2.0, 1.0)
+
+
+@dataclass
+class SearchResult:
+    """Ranked search hits plus the cascade stage that produced them"""
+    hits: List[Tuple[int, float]] = field(default_factory=list)
+    # "all" (every token), "fuzzy" (typo corrected), "any" (some token) or "none"
+    stage: str = "none"
+    backend: str = ""
+    # Number of matching products before paging
+    total: int = 0
+    # Text matches of the chosen stage before attribute filters (for facet counts)
+    matched_ids: Set[int] = field(default_factory=set)
+
+    @property
+    def ids(self) -> List[int]:
+        return [pid for pid, _ in self.hits]
+
+
+def _page(
+    hits: List[Tuple[int, float]],
+    limit: Optional[int],
+    after: Optional[Tuple[float, int]],
+) -> List[Tuple[int, float]]:
+    """Hits ranked below `after` (score, id), cut to limit"""
+    if after is not None:
+        boundary = (after[0], -after[1])
+        hits = [(pid, score) for pid, score in hits if (score, -pid) < boundary]
+    return hits if limit is None else hits[:limit]
+
+
+class MemorySearchBackend:
+    """Inverted index with typo correction and BM25F ranking"""
+    name = "memory"
+
+    def available(self, db: Session) -> bool:
+        return True
+
+    def search(
+        self,
+        db: Session,
+        text: str,
+        allowed_ids: Container[int],
+        limit: Optional[int] = None,
+        after: Optional[Tuple[float, int]] = None,
+    ) -> SearchResult:
+        stages = (
+            ("all", dict(match_all=True)),
+            ("fuzzy", dict(match_all=True, fuzzy=True)),
+            ("any", dict(match_all=False, fuzzy=True)),
+        )
+        for stage, options in stages:
+            text_ids = search_index.search(text, **options)
+            ids = text_ids & allowed_ids
+            if ids:
+                hits = search_index.rank(text, ids, limit=limit, after=after)
+                return SearchResult(hits, stage, self.name, len(ids), text_ids)
+        return SearchResult(backend=self.name)
+
+
+class PostgresFullTextBackend:
+    """Postgres full-text search over a trigger-maintained tsvector column"""
+    name = "postgres"
+
+    def available(self, db: Session) -> bool:
+        row = db.execute(sql_text(
+            "SELECT 1 FROM information_schema.columns "
+            "WHERE table_name = 'products' AND column_name = 'search_vector'"
+        )).first()
+        return row is not None
+
+    def _query(self, db: Session, tokens: List[str], operator: str) -> List[Tuple[int, float]]:
+        # Tokens are alphanumeric only, so they are safe inside to_tsquery syntax
+        query = f" {operator} ".join(f"{tok}:*" for tok in tokens)
+        rows = db.execute(sql_text(
+            "SELECT id, ts_rank_cd('{0.1, 0.2, 0.4, 1.0}', search_vector, q) AS score "
+            "FROM products, to_tsquery('english', :query) AS q "
+            "WHERE search_vector @@ q "
+            "ORDER BY score DESC, id"
+        ), {"query": query}).all()
+        return [(row[0], float(row[1])) for row in rows]
+
+    def search(
+        self,
+        db: Session,
+        text: str,
+        allowed_ids: Container[int],
+        limit: Optional[int] = None,
+        after: Optional[Tuple[float, int]] = None,
+    ) -> SearchResult:
+        tokens = tokenize(text)
+        if not tokens:
+            return SearchResult(backend=self.name)
+        for stage, operator in (("all", "&"), ("any", "|")):
+            matches = self._query(db, tokens, operator)
+            hits = [(pid, score) for pid, score in matches if pid in allowed_ids]
+            if hits:
+                matched_ids = {pid for pid, _ in matches}
+                return SearchResult(_page(hits, limit, after), stage, self.name, len(hits), matched_ids)
+        return SearchResult(backend=self.name)
+
+
+class SqliteFts5Backend:
+    """SQLite FTS5 virtual table kept in sync with products by triggers"""
+    name = "sqlite-fts5"
+
+    def available(self, db: Session) -> bool:
+        row = db.execute(sql_text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'products_fts'"
+        )).first()
+        return row is not None
+
+    def _query(self, db: Session, tokens: List[str], operator: str) -> List[Tuple[int, float]]:
+        query = f" {operator} ".join(f'"{tok}"*' for tok in tokens)
+        weights = ", ".join(str(w) for w in FTS_FIELD_WEIGHTS)
+        rows = db.execute(sql_text(
+            f"SELECT rowid, bm25(products_fts, {weights}) AS rank "
+            "FROM products_fts WHERE products_fts MATCH :query "
+            "ORDER BY rank, rowid"
+        ), {"query": query}).all()
+        # FTS5 bm25() is lower-is-better; flip it so every backend scores higher-is-better
+        return [(row[0], -float(row[1])) for row in rows]
+
+    def search(
+        self,
+        db: Session,
+        text: str,
+        allowed_ids: Container[int],
+        limit: Optional[int] = None,
+        after: Optional[Tuple[float, int]] = None,
+    ) -> SearchResult:
+        tokens = tokenize(text)
+        if not tokens:
+            return SearchResult(backend=self.name)
+        for stage, operator in (("all", "AND"), ("any", "OR")):
+            matches = self._query(db, tokens, operator)
+            hits = [(pid, score) for pid, score in matches if pid in allowed_ids]
+            if hits:
+                matched_ids = {pid for pid, _ in matches}
+                return SearchResult(_page(hits, limit, after), stage, self.name, len(hits), matched_ids)
+        return SearchResult(backend=self.name)
+
+
+memory_backend = MemorySearchBackend()
+_warned_unavailable = False
+
+
+def database_backend(db: Session):
+    """Full-text backend matching the session's database dialect"""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        return PostgresFullTextBackend()
+    if dialect == "sqlite":
+        return SqliteFts5Backend()
+    return None
+
+
+def get_search_backend(db: Session):
+    """Backend selected by SEARCH_BACKEND, falling back to memory when not installed"""
+    global _warned_unavailable
+    if SEARCH_BACKEND != "database":
+        return memory_backend
+    backend = database_backend(db)
+    if backend is not None and backend.available(db):
+        return backend
+    if not _warned_unavailable:
+        print("WARN: database search backend not installed (run init_schema.py); using memory index")
+        _warned_unavailable = True
+    return memory_backend
+
+
+POSTGRES_DDL = [
+    "ALTER TABLE products ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    """
+    CREATE OR REPLACE FUNCTION products_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.name, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.category, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS products_search_vector_trigger ON products",
+    """
+    CREATE TRIGGER products_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF name, category, description ON products
+    FOR EACH ROW EXECUTE FUNCTION products_search_vector_update()
+    """,
+    # Touching name fires the trigger, backfilling existing rows
+    "UPDATE products SET name = name WHERE search_vector IS NULL",
+    "CREATE INDEX IF NOT EXISTS ix_products_search_vector ON products USING GIN (search_vector)",
+]
+
+SQLITE_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+        name, category, description,
+        content='products', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+        INSERT INTO products_fts(rowid, name, category, description)
+        VALUES (new.id, new.name, new.category, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, category, description)
+        VALUES ('delete', old.id, old.name, old.category, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE ON products BEGIN
+        INSERT INTO products_fts(products_fts, rowid, name, category, description)
+        VALUES ('delete', old.id, old.name, old.category, old.description);
+        INSERT INTO products_fts(rowid, name, category, description)
+        VALUES (new.id, new.name, new.category, new.description);
+    END
+    """,
+    "INSERT INTO products_fts(products_fts) VALUES ('rebuild')",
+]
+
+
+def install_fulltext(engine) -> None:
+    """Create the full-text column/table, sync triggers and index for this database"""
+    statements = {"postgresql": POSTGRES_DDL, "sqlite": SQLITE_DDL}.get(engine.dialect.name)
+    if not statements:
+        print(f"WARN: no full-text search support for dialect {engine.dialect.name}")
+        return
+    with engine.begin() as conn:
+        for statement in statements:
+            conn.execute(sql_text(statement))
+    print(f"✅ Full-text search installed for {engine.dialect.name}.")
@@ -0,0 +1,185 @@
+"""
+Content-based product similarity from hashed TF-IDF vectors.
+
+Each product's name, category and description are turned into word and
+character-trigram features. The features are hashed into a fixed number of
+columns, so products can be added without rebuilding a vocabulary, and
+weighted by TF-IDF. The L2-normalised rows form a dense NumPy matrix. A
+"similar to this text / this product" question is then one matrix-vector
+product plus argpartition, instead of scoring products one by one in Python.
+Raw counts are kept sparse per product; admin edits only update them and the
+document frequencies, and the matrix is reweighted on the next read.
+
+Zero-result searches use it to show the nearest products. Related-product
+lists use it to fill up categories with too few products.
+"""
+import os
+import threading
+import zlib
+from typing import Collection, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from app.search import FIELD_WEIGHTS, tokenize
+
+SIMILARITY_DIMENSIONS = int(os.getenv("SIMILARITY_DIMENSIONS", "2048"))
+# Cosine below which a match is mostly hash collisions and stray trigrams
+SIMILARITY_MIN_SCORE = float(os.getenv("SIMILARITY_MIN_SCORE", "0.05"))
+# Character trigrams catch plurals and misspellings; they count for less than whole words
+TRIGRAM_WEIGHT = 0.5
+
+
+def _features(texts: Iterable) -> Dict[str, float]:
+    """Weighted word and trigram counts for (text, weight) pairs"""
+    features: Dict[str, float] = {}
+    for text, weight in texts:
+        for token in tokenize(text):
+            features["w:" + token] = features.get("w:" + token, 0.0) + weight
+            padded = f"#{token}#"
+            for i in range(len(padded) - 2):
+                key = "t:" + padded[i:i + 3]
+                features[key] = features.get(key, 0.0) + weight * TRIGRAM_WEIGHT
+    return features
+
+
+def _product_features(product) -> Dict[str, float]:
+    return _features((getattr(product, field, None), weight) for field, weight in FIELD_WEIGHTS.items())
+
+
+def _bucket(feature: str, dimensions: int) -> int:
+    # crc32 rather than hash(): every worker must put a feature in the same column
+    return zlib.crc32(feature.encode("utf-8")) % dimensions
+
+
+def _top_ids(ids: np.ndarray, scores: np.ndarray, limit: int) -> List[int]:
+    """Ids of the limit highest scores above SIMILARITY_MIN_SCORE, best first (ties by lower id)"""
+    relevant = scores >= SIMILARITY_MIN_SCORE
+    ids, scores = ids[relevant], scores[relevant]
+    if len(ids) > limit:
+        keep = np.argpartition(-scores, limit - 1)[:limit]
+        ids, scores = ids[keep], scores[keep]
+    order = np.lexsort((ids, -scores))
+    return ids[order].tolist()
+
+
+class ContentSimilarity:
+    """Dense TF-IDF matrix over the catalog, one row per product"""
+
+    def __init__(self, dimensions: int = SIMILARITY_DIMENSIONS):
+        self.dimensions = dimensions
+        self._lock = threading.Lock()
+        # Raw hashed term frequencies per product, sparse: (columns, weights)
+        self._terms: Dict[int, Tuple[np.ndarray, np.ndarray]] = {}
+        # Number of products with a non-zero count in each column
+        self._df = np.zeros(dimensions, dtype=np.int64)
+        # TF-IDF weighted, normalised rows; rebuilt on the first read after a change
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._row: Dict[int, int] = {}
+        self._idf = np.zeros(dimensions, dtype=np.float32)
+        self._vectors = np.zeros((0, dimensions), dtype=np.float32)
+        self._dirty = False
+        self.ready = False
+
+    def _sparse(self, features: Dict[str, float]) -> Tuple[np.ndarray, np.ndarray]:
+        buckets: Dict[int, float] = {}
+        for feature, weight in features.items():
+            column = _bucket(feature, self.dimensions)
+            buckets[column] = buckets.get(column, 0.0) + weight
+        columns = np.fromiter(buckets.keys(), dtype=np.int64, count=len(buckets))
+        weights = np.fromiter(buckets.values(), dtype=np.float32, count=len(buckets))
+        return columns, weights
+
+    def build(self, products: Iterable) -> None:
+        """Recompute the matrix from an iterable of catalog views"""
+        terms = {p.id: self._sparse(_product_features(p)) for p in products}
+        df = np.zeros(self.dimensions, dtype=np.int64)
+        for columns, _ in terms.values():
+            df[columns] += 1
+        with self._lock:
+            self._terms = terms
+            self._df = df
+            self._reweight()
+            self.ready = True
+
+    def upsert(self, product) -> None:
+        """Add or replace one product's row (the matrix is reweighted on the next read)"""
+        columns, weights = self._sparse(_product_features(product))
+        with self._lock:
+            old = self._terms.get(product.id)
+            if old is not None:
+                self._df[old[0]] -= 1
+            self._terms[product.id] = (columns, weights)
+            self._df[columns] += 1
+            self._dirty = True
+
+    def remove(self, product_id: int) -> None:
+        with self._lock:
+            old = self._terms.pop(product_id, None)
+            if old is None:
+                return
+            self._df[old[0]] -= 1
+            self._dirty = True
+
+    def _reweight(self) -> None:
+        # Document frequencies change with every row, so the whole matrix is
+        # reweighted; writes only mark it dirty, so a burst of admin edits pays once
+        documents = len(self._terms)
+        self._idf = (np.log((1 + documents) / (1 + self._df)) + 1).astype(np.float32)
+        ids = np.fromiter(self._terms.keys(), dtype=np.int64, count=documents)
+        vectors = np.zeros((documents, self.dimensions), dtype=np.float32)
+        if documents:
+            rows = np.concatenate([np.full(len(c), i) for i, (c, _) in enumerate(self._terms.values())])
+            columns = np.concatenate([c for c, _ in self._terms.values()])
+            weights = np.concatenate([w for _, w in self._terms.values()])
+            vectors[rows, columns] = weights * self._idf[columns]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        self._ids = ids
+        self._row = {int(pid): i for i, pid in enumerate(ids)}
+        vectors /= norms
+        self._vectors = vectors
+        self._dirty = False
+
+    def _refresh(self) -> None:
+        # Caller holds the lock; catches up with upserts and removals since the last read
+        if self._dirty:
+            self._reweight()
+
+    def _nearest(self, ids: np.ndarray, vectors: np.ndarray, query: np.ndarray, limit: int,
+                 allowed: Optional[Collection[int]], exclude: Collection[int]) -> List[int]:
+        if limit <= 0 or not len(ids):
+            return []
+        scores = vectors @ query
+        if allowed is not None or exclude:
+            mask = np.fromiter(
+                ((allowed is None or pid in allowed) and pid not in exclude for pid in ids.tolist()),
+                dtype=bool, count=len(ids),
+            )
+            ids, scores = ids[mask], scores[mask]
+        return _top_ids(ids, scores, limit)
+
+    def query(self, text: str, limit: int, allowed: Optional[Collection[int]] = None) -> List[int]:
+        """Ids of the products closest to free text, best first"""
+        columns, weights = self._sparse(_features([(text, FIELD_WEIGHTS["name"])]))
+        with self._lock:
+            self._refresh()
+            ids, vectors, idf = self._ids, self._vectors, self._idf
+        query = np.zeros(self.dimensions, dtype=np.float32)
+        query[columns] = weights * idf[columns]
+        norm = np.linalg.norm(query)
+        if not norm:
+            return []
+        return self._nearest(ids, vectors, query / norm, limit, allowed, ())
+
+    def similar(self, product_id: int, limit: int, exclude: Collection[int] = ()) -> List[int]:
+        """Ids of the products whose text is closest to this product's, best first"""
+        with self._lock:
+            self._refresh()
+            index = self._row.get(product_id)
+            if index is None:
+                return []
+            ids, vectors = self._ids, self._vectors
+        return self._nearest(ids, vectors, vectors[index], limit, None, set(exclude) | {product_id})
+
+
+content_similarity = ContentSimilarity()
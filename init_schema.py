@@ -2,6 +2,7 @@ import os
 from sqlalchemy import create_engine
 from app.database import Base
 from app import models  # noqa: F401 ensure models are imported so Base has metadata
+from app.schema import upgrade_schema
 
 
 def main():
@@ -18,6 +19,9 @@ def main():
     Base.metadata.create_all(bind=engine)
     print("✅ Schema initialized successfully.")
 
+    # Indexes, columns and backfills for databases created by older versions
+    upgrade_schema(engine)
+
 
 if __name__ == "__main__":
     main()
@@ -71,22 +71,47 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
-    // Enhanced search functionality with debouncing
-    const searchInput = document.querySelector('input[name="search"]');
-    if (searchInput) {
+    // Search typeahead: debounced completions from /products/suggest into the shared datalist
+    const suggestionList = document.getElementById('searchSuggestions');
+    const suggestionCache = new Map();
+    function showSuggestions(suggestions) {
+        suggestionList.innerHTML = '';
+        suggestions.forEach(suggestion => {
+            const option = document.createElement('option');
+            option.value = suggestion.text;
+            option.label = suggestion.type === 'category' ? 'Category' : '';
+            suggestionList.appendChild(option);
+        });
+    }
+    document.querySelectorAll('input[name="search"][list="searchSuggestions"]').forEach(searchInput => {
+        if (!suggestionList) {
+            return;
+        }
         let searchTimeout;
         searchInput.addEventListener('input', function() {
             clearTimeout(searchTimeout);
-            searchInput.classList.add('loading');
-            
+            const prefix = searchInput.value.trim().toLowerCase();
+            if (!prefix) {
+                showSuggestions([]);
+                return;
+            }
+            if (suggestionCache.has(prefix)) {
+                showSuggestions(suggestionCache.get(prefix));
+                return;
+            }
             searchTimeout = setTimeout(() => {
-                // Simulate search delay (remove in production)
-                setTimeout(() => {
-                    searchInput.classList.remove('loading');
-                }, 500);
-            }, 300);
+                fetch('/products/suggest?q=' + encodeURIComponent(prefix))
+                    .then(response => response.ok ? response.json() : { suggestions: [] })
+                    .then(data => {
+                        suggestionCache.set(prefix, data.suggestions);
+                        if (searchInput.value.trim().toLowerCase() === prefix) {
+                            showSuggestions(data.suggestions);
+                        }
+                    })
+                    .catch(error => console.error('Suggestion request failed:', error));
+            }, 120);
         });
-    }
+    });
 
     // Enhanced product card interactions
     document.querySelectorAll('.product-card').forEach(card => {
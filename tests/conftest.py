@@ -0,0 +1,31 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Routers resolve templates/ and static/ relative to the working directory
+os.chdir(ROOT)
+
+from app.catalog import ProductView  # noqa: E402
+
+
+def make_view(product_id, name, category="Sports", price=100.0, description=None, sizes=("8", "9"), version=1):
+    return ProductView(
+        id=product_id, name=name, description=description, price=price, category=category,
+        status="Available", gender=None, image_url=None, images=(), sizes=tuple(sizes), version=version,
+    )
+
+
+@pytest.fixture
+def views():
+    return [
+        make_view(1, "Nike Air Max 270", "Sports", 120.0, "Comfortable running shoes with cushioning"),
+        make_view(2, "Adidas Ultraboost", "Sports", 180.0, "Premium running shoes"),
+        make_view(3, "Converse Chuck Taylor", "Casual", 60.0, "Classic canvas sneakers"),
+        make_view(4, "Dr. Martens 1460", "Boots", 150.0, "Classic leather boots"),
+        make_view(5, "New Balance 990", "Sneakers", 175.0, "Premium running shoes with stability"),
+        make_view(6, "ASICS Gel-Kayano", "Sneakers", 160.0, "Stability running shoes"),
+        make_view(7, "Birkenstock Arizona", "Sandals", 100.0, "Comfortable sandals with footbed"),
+    ]
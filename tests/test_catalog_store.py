@@ -0,0 +1,28 @@
+from app import catalog_store
+from app.catalog_store import read_snapshot, snapshot_version, write_snapshot
+from conftest import make_view
+
+
+def test_round_trip(tmp_path, views):
+    path = str(tmp_path / "catalog.snapshot")
+    edited = make_view(8, "Line\nbreak é", description=None, sizes=())
+    write_snapshot(list(reversed(views)) + [edited], 12, path)
+    assert snapshot_version(path) == 12
+    version, loaded = read_snapshot(path)
+    assert version == 12
+    assert loaded == sorted(views, key=lambda v: v.id) + [edited]
+
+
+def test_missing_foreign_or_truncated_files_are_ignored(tmp_path, views, monkeypatch):
+    path = str(tmp_path / "catalog.snapshot")
+    assert read_snapshot(path) is None and snapshot_version(path) == 0
+    write_snapshot(views, 3, path)
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(data[:data.rindex(b"\n", 0, len(data) - 1) + 1])
+    assert read_snapshot(path) is None
+    write_snapshot(views, 3, path)
+    # A file written by an earlier server run
+    monkeypatch.setattr(catalog_store, "GENERATION", "another-run")
+    assert read_snapshot(path) is None and snapshot_version(path) == 0
@@ -0,0 +1,68 @@
+import os
+import time
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models  # noqa: F401 registers every table on Base
+from app.database import Base
+from app.event_log import EVENT_SEGMENT_SECONDS, EventLog, compaction_lock, daily_totals
+
+
+def _open_segment(directory, name, age):
+    path = os.path.join(directory, name)
+    with open(path, "w") as f:
+        f.write(f"{int(time.time())}\tview\t1\n")
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return path
+
+
+def test_only_stale_open_segments_are_sealed(tmp_path):
+    log = EventLog(str(tmp_path))
+    # Same PID as a live worker: only the age of the last write decides
+    stale = _open_segment(str(tmp_path), f"events-{os.getpid()}-1.open", EVENT_SEGMENT_SECONDS + 3600)
+    fresh = _open_segment(str(tmp_path), "events-1-2.open", 5)
+    log.record("view", [3])
+    log.flush()
+    own = log._segment
+    os.utime(own, (0, 0))
+    sealed = log.sealed_segments()
+    assert sealed == [stale[:-len(".open")] + ".log"]
+    assert os.path.exists(fresh) and os.path.exists(own)
+
+
+def test_writer_starts_a_new_segment_when_its_own_was_sealed(tmp_path):
+    log = EventLog(str(tmp_path))
+    log.record("view", [1])
+    log.flush()
+    first = log._segment
+    os.replace(first, first[:-len(".open")] + ".log")
+    log.record("view", [2])
+    log.flush()
+    assert log._segment != first and os.path.exists(log._segment)
+
+
+def test_compaction_lock_is_exclusive(tmp_path):
+    with compaction_lock(str(tmp_path)) as first:
+        with compaction_lock(str(tmp_path)) as second:
+            assert first and not second
+    with compaction_lock(str(tmp_path)) as again:
+        assert again
+
+
+def test_compact_rolls_events_into_daily_totals(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'events.db'}")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    log = EventLog(str(tmp_path / "events"))
+    log.record("search", [1, 2])
+    log.record("view", [1])
+    log.flush()
+    log.seal()
+    assert log.compact(db) == 1
+    assert log.compact(db) == 0
+    today = daily_totals(db, days=1)[0]
+    assert (today["searches"], today["views"], today["favourites"]) == (2, 1, 0)
+    db.close()
+    engine.dispose()
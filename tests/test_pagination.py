@@ -0,0 +1,66 @@
+import base64
+import json
+
+from app.catalog import catalog
+from app.pagination import decode_cursor, encode_cursor, keyset_slice
+from app.routers import products
+
+
+def _load(views):
+    catalog.load_views(views, 1)
+    products._build_catalog_indexes()
+
+
+def test_keyset_slice_walks_every_item_once():
+    ordered = [(pid, pid) for pid in range(1, 11)]
+    seen, cursor = [], None
+    while True:
+        page, next_cursor = keyset_slice(ordered, decode_cursor(cursor), 3, lambda pid: pid % 2 == 0)
+        seen += page
+        if next_cursor is None:
+            break
+        cursor = next_cursor
+    assert seen == [2, 4, 6, 8, 10]
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(-1.5, 7)) == (-1.5, 7)
+    assert decode_cursor(encode_cursor("nike", 3)) == ("nike", 3)
+
+
+def _raw_cursor(value):
+    raw = json.dumps(value).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def test_forged_cursors_are_rejected():
+    for forged in (["a"], [None, 1], [[1], 1], [{"x": 1}, 1], [True, 1], [1, "2"], [1, 2, 3], 5, [float("nan"), 1]):
+        assert decode_cursor(_raw_cursor(forged)) is None
+    assert decode_cursor("not base64!") is None
+
+
+def test_non_numeric_cursor_does_not_break_search(views):
+    _load(views)
+    for forged in (encode_cursor("a", 1), encode_cursor(None, 1), encode_cursor([1], 1)):
+        results = products._catalog_results(None, "running", {}, forged, 2)
+        assert [p.id for p in results["products"]]
+
+
+def test_category_fallback_pages_with_load_more(views):
+    _load(views)
+    filters = {"category": "Sneakers"}
+    first = products._catalog_results(None, "qqqq", filters, None, 1)
+    assert first["search_stage"] == "fallback:category"
+    assert [p.id for p in first["products"]] == [5]
+    assert first["next_cursor"]
+    second = products._catalog_results(None, "qqqq", filters, first["next_cursor"], 1)
+    assert [p.id for p in second["products"]] == [6]
+    assert second["next_cursor"] is None
+
+
+def test_single_page_fallback_has_no_more_pages(views):
+    _load(views)
+    first = products._catalog_results(None, "qqqq", {}, None, 2)
+    assert first["next_cursor"] is None
+    later = products._catalog_results(None, "qqqq", {}, encode_cursor(5, 5), 2)
+    assert later["products"] == []
@@ -0,0 +1,121 @@
+from collections import Counter
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app import models  # noqa: F401 registers every table on Base
+from app.database import Base
+from app.models import ProductDailyStat, ProductStat
+from app.product_stats import (CounterBuffer, StatsFlusher, additive_upsert, load_totals,
+                               upsert_counts)
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(bind=engine)
+    engine.dispose()
+
+
+def _column(db, column):
+    return dict(db.query(ProductStat.product_id, getattr(ProductStat, column)))
+
+
+def test_additive_upsert_inserts_then_adds(session_factory):
+    db = session_factory()
+    table = ProductDailyStat.__table__
+    keys = ["day", "product_id"]
+    additive_upsert(db, table, keys, [{"day": "2026-01-01", "product_id": 1, "searches": 2, "views": 1,
+                                       "favourites": 0}])
+    additive_upsert(db, table, keys, [
+        {"day": "2026-01-01", "product_id": 1, "searches": 3, "views": 0, "favourites": 1},
+        {"day": "2026-01-02", "product_id": 1, "searches": 1, "views": 0, "favourites": 0},
+    ])
+    db.commit()
+    rows = {(r.day, r.product_id): (r.searches, r.views, r.favourites) for r in db.query(ProductDailyStat)}
+    assert rows == {("2026-01-01", 1): (5, 1, 1), ("2026-01-02", 1): (1, 0, 0)}
+    db.close()
+
+
+def test_additive_upsert_overwrite_columns_and_batches(session_factory, monkeypatch):
+    monkeypatch.setattr("app.product_stats.UPSERT_BATCH", 2)
+    db = session_factory()
+    upsert_counts(db, "views", {pid: 1 for pid in range(1, 6)})
+    first = datetime(2026, 1, 1)
+    additive_upsert(db, ProductStat.__table__, ["product_id"],
+                    [{"product_id": 3, "views": 4, "last_activity": first}], overwrite=["last_activity"])
+    db.commit()
+    assert _column(db, "views") == {1: 1, 2: 1, 3: 5, 4: 1, 5: 1}
+    assert db.get(ProductStat, 3).last_activity == first
+    # Untouched columns keep their server defaults
+    assert _column(db, "searches") == {pid: 0 for pid in range(1, 6)}
+    db.close()
+
+
+def test_repeated_flushes_add_up(session_factory):
+    searches = CounterBuffer("searches", keep_totals=True)
+    views = CounterBuffer("views")
+    flushed = []
+    flusher = StatsFlusher([searches, views])
+    flusher._session_factory = session_factory
+    flusher._on_flush = lambda buffer: flushed.append(dict(buffer.totals))
+
+    searches.add([1, 2, 1])
+    views.add([2])
+    flusher.flush()
+    searches.add([1, 3])
+    views.add([2, 2])
+    flusher.flush()
+    # Nothing pending: a flush must not change the totals
+    flusher.flush()
+
+    db = session_factory()
+    assert _column(db, "searches") == {1: 3, 2: 1, 3: 1}
+    assert _column(db, "views") == {1: 0, 2: 3, 3: 0}
+    assert load_totals(db, "views") == {2: 3}
+    db.close()
+    assert searches.pending() == 0 and views.pending() == 0
+    assert flushed[-1] == {1: 3, 2: 1, 3: 1}
+
+
+def test_failed_flush_restores_counts(session_factory, monkeypatch):
+    views = CounterBuffer("views")
+    flusher = StatsFlusher([views])
+    flusher._session_factory = session_factory
+    views.add([7, 7])
+
+    def broken(db, column, counts):
+        raise RuntimeError("database is locked")
+
+    monkeypatch.setattr("app.product_stats.upsert_counts", broken)
+    flusher.flush()
+    assert views.pending() == 2
+    monkeypatch.undo()
+    flusher.flush()
+    db = session_factory()
+    assert _column(db, "views") == {7: 2}
+    db.close()
+
+
+def test_full_buffer_wakes_the_flusher():
+    views = CounterBuffer("views", max_pending=3)
+    flusher = StatsFlusher([views])
+    views.add([1, 2])
+    assert not flusher._wake.is_set()
+    views.add([3])
+    assert flusher._wake.is_set()
+    assert views.drain() == Counter({1: 1, 2: 1, 3: 1})
+
+
+def test_removed_favourites_never_go_negative(session_factory):
+    db = session_factory()
+    upsert_counts(db, "favourites", {1: 2, 2: 1})
+    db.commit()
+    upsert_counts(db, "favourites", {1: -1, 2: -3, 3: -1, 4: 1})
+    db.commit()
+    # No row is created for product 3, and product 2 stops at zero
+    assert _column(db, "favourites") == {1: 1, 2: 0, 4: 1}
+    db.close()
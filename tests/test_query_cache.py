@@ -0,0 +1,96 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.query_cache import QueryCache
+
+
+class Computation:
+    """compute callable that counts its calls and blocks until released"""
+
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+        self.release = threading.Event()
+
+    def __call__(self):
+        self.calls += 1
+        assert self.release.wait(5)
+        return self.value
+
+
+def test_concurrent_misses_compute_once():
+    async def scenario():
+        cache = QueryCache()
+        compute = Computation("rows")
+        waiters = [asyncio.ensure_future(cache.get("q", 1, compute)) for _ in range(10)]
+        await asyncio.sleep(0.05)
+        assert not any(w.done() for w in waiters)
+        compute.release.set()
+        results = await asyncio.gather(*waiters)
+        assert results == [("rows", 1)] * 10
+        assert compute.calls == 1 and cache.misses == 10
+        # The stored entry now answers without computing
+        assert await cache.get("q", 1, compute) == ("rows", 1)
+        assert compute.calls == 1 and cache.hits == 1
+
+    asyncio.run(scenario())
+
+
+def test_stale_hit_serves_old_value_and_refreshes_once():
+    async def scenario():
+        cache = QueryCache(soft_ttl=60, hard_ttl=600)
+        first = Computation("old")
+        first.release.set()
+        assert await cache.get("q", 1, first) == ("old", 1)
+
+        # An admin edit bumped the catalog version: the entry is stale but servable
+        refresh = Computation("new")
+        stale = [await cache.get("q", 2, refresh) for _ in range(5)]
+        assert stale == [("old", 1)] * 5
+        assert cache.stale_hits == 5
+        await asyncio.sleep(0.05)
+        assert refresh.calls == 1
+
+        refresh.release.set()
+        await cache._inflight["q"]
+        assert await cache.get("q", 2, refresh) == ("new", 2)
+        assert refresh.calls == 1 and not cache._inflight
+
+    asyncio.run(scenario())
+
+
+def test_failed_miss_reaches_every_waiter_and_is_retried():
+    async def scenario():
+        cache = QueryCache()
+        calls = []
+
+        def broken():
+            calls.append(1)
+            raise RuntimeError("database went away")
+
+        waiters = [asyncio.ensure_future(cache.get("q", 1, broken)) for _ in range(3)]
+        results = await asyncio.gather(*waiters, return_exceptions=True)
+        assert all(isinstance(r, RuntimeError) for r in results) and len(calls) == 1
+        assert not cache._inflight
+        with pytest.raises(RuntimeError):
+            await cache.get("q", 1, broken)
+        assert len(calls) == 2
+
+    asyncio.run(scenario())
+
+
+def test_expired_entries_are_recomputed_and_lru_is_bounded():
+    async def scenario():
+        cache = QueryCache(soft_ttl=0, hard_ttl=0, max_entries=2)
+        for key in ("a", "b", "c"):
+            compute = Computation(key)
+            compute.release.set()
+            assert await cache.get(key, 1, compute) == (key, 1)
+        assert list(cache._entries) == ["b", "c"]
+        again = Computation("c2")
+        again.release.set()
+        assert await cache.get("c", 1, again) == ("c2", 1)
+
+    asyncio.run(scenario())
@@ -0,0 +1,124 @@
+import random
+from collections import Counter
+
+from app.query_log import QueryLog, SpaceSaving, normalize_query
+
+
+def _stream(seed=7, length=5000):
+    """Skewed query stream: a few heavy hitters over a long tail"""
+    rng = random.Random(seed)
+    heavy = ["running shoes", "boots", "sandals"]
+    items = []
+    for _ in range(length):
+        if rng.random() < 0.4:
+            items.append(rng.choice(heavy))
+        else:
+            items.append(f"tail {rng.randrange(2000)}")
+    return items
+
+
+def _sketch(items, capacity):
+    sketch = SpaceSaving(capacity)
+    for item in items:
+        sketch.offer(item)
+    return sketch
+
+
+def _assert_bounds(sketch, truth, total):
+    assert len(sketch.counts) <= sketch.capacity
+    for item, count in sketch.counts.items():
+        assert count - sketch.errors[item] <= truth[item] <= count
+    # Anything seen more than total / capacity times must still be tracked
+    for item, n in truth.items():
+        if n > total / sketch.capacity:
+            assert item in sketch.counts
+
+
+def test_normalize_query():
+    assert normalize_query("  Nike   AIR-max!! ") == "nike air max"
+    assert normalize_query(None) == ""
+    assert len(normalize_query("x" * 500)) == 100
+
+
+def test_exact_below_capacity():
+    sketch = _sketch(["a", "b", "a", "c", "a", "b"], capacity=10)
+    assert sketch.counts == {"a": 3, "b": 2, "c": 1}
+    assert set(sketch.errors.values()) == {0}
+    assert [row["query"] for row in sketch.top(2)] == ["a", "b"]
+
+
+def test_error_bounds_and_heavy_hitters():
+    items = _stream()
+    sketch = _sketch(items, capacity=50)
+    _assert_bounds(sketch, Counter(items), len(items))
+    assert [row["query"] for row in sketch.top(3)] == sorted(
+        ["running shoes", "boots", "sandals"], key=lambda q: -sketch.counts[q]
+    )
+
+
+def test_merge_keeps_bounds():
+    items = _stream(seed=11, length=8000)
+    left, right = items[:3000], items[3000:]
+    merged = _sketch(left, capacity=50)
+    merged.merge(_sketch(right, capacity=50))
+    _assert_bounds(merged, Counter(items), len(items))
+    assert {row["query"] for row in merged.top(3)} == {"running shoes", "boots", "sandals"}
+
+
+def test_merge_exact_when_small():
+    sketch = _sketch(["a", "b", "a"], capacity=10)
+    sketch.merge(_sketch(["b", "c"], capacity=10))
+    assert sketch.counts == {"a": 2, "b": 2, "c": 1}
+    # Merged sketches keep accepting offers
+    sketch.offer("c", 5)
+    assert sketch.top(1)[0] == {"query": "c", "count": 6, "error": 0}
+
+
+def test_round_trip_through_dict():
+    sketch = _sketch(_stream(length=1000), capacity=20)
+    restored = SpaceSaving.from_dict(sketch.to_dict(), capacity=20)
+    assert restored.counts == sketch.counts and restored.errors == sketch.errors
+    restored.offer("new query")
+    assert len(restored.counts) == 20
+
+
+def test_compact_folds_sealed_segments(tmp_path):
+    log = QueryLog(str(tmp_path))
+    log.record("Running Shoes", 3, "all")
+    log.record("running   shoes", 3, "all")
+    log.record("glitter boots", 0, "fallback:latest")
+    log.flush()
+    log.seal()
+    assert log.compact() == 1
+    report = log.report()
+    assert report["top"][0] == {"query": "running shoes", "count": 2, "error": 0}
+    assert [row["query"] for row in report["zero"]] == ["glitter boots"]
+    # Folded segments are not counted again
+    assert log.compact() == 0
+    assert log.report()["top"][0]["count"] == 2
+
+
+def test_from_counts_keeps_the_largest_exactly():
+    counts = Counter({"boots": 50, "sandals": 30, **{f"tail {i}": 1 for i in range(20)}})
+    sketch = SpaceSaving.from_counts(counts, capacity=5)
+    assert sketch.counts["boots"] == 50 and sketch.errors["boots"] == 0
+    assert sketch.counts["sandals"] == 30 and sketch.errors["sandals"] == 0
+    _assert_bounds(sketch, counts, sum(counts.values()))
+
+
+def test_compaction_merges_segments_within_capacity(tmp_path, monkeypatch):
+    monkeypatch.setattr("app.query_log.QUERY_SKETCH_CAPACITY", 5)
+    log = QueryLog(str(tmp_path))
+    truth = Counter()
+    for segment in range(3):
+        queries = ["boots"] * 10 + [f"tail {segment} {i}" for i in range(8)]
+        for query in queries:
+            log.record(query, 1, "all")
+        truth.update(queries)
+        log.flush()
+        log.seal()
+        log.compact()
+    top, _, _ = log._load()
+    assert top.capacity == 5 and len(top.counts) == 5
+    assert top.top(1)[0]["query"] == "boots"
+    _assert_bounds(top, truth, sum(truth.values()))
@@ -0,0 +1,31 @@
+from app.recommendations import AlsoFavourited
+
+FAVOURITES = [(1, 10), (1, 11), (2, 10), (2, 11), (2, 12), (3, 12), (3, 13)]
+
+
+def test_neighbours_by_shared_favouriters():
+    recs = AlsoFavourited(k=2)
+    recs.build(FAVOURITES)
+    assert recs.for_product(10) == [11, 12]
+    assert recs.for_products([12]) == [13, 10]
+
+
+def test_rebuild_only_bumps_version_on_change():
+    recs = AlsoFavourited()
+    recs.build(FAVOURITES)
+    version = recs.version
+    recs.build(list(reversed(FAVOURITES)))
+    assert recs.version == version
+    recs.build(FAVOURITES + [(4, 13), (4, 10)])
+    assert recs.version == version + 1
+
+
+def test_incremental_add_matches_full_build():
+    incremental = AlsoFavourited()
+    incremental.build(FAVOURITES)
+    incremental.add(4, 13)
+    incremental.add(4, 10)
+    full = AlsoFavourited()
+    full.build(FAVOURITES + [(4, 13), (4, 10)])
+    for pid in (10, 11, 12, 13):
+        assert incremental.for_product(pid) == full.for_product(pid)
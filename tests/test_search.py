@@ -0,0 +1,119 @@
+from app.search import IdBitmap, ProductSearchIndex, edit_distance, tokenize
+from conftest import make_view
+
+
+def _index(views):
+    index = ProductSearchIndex()
+    index.build(views)
+    return index
+
+
+def test_tokenize():
+    assert tokenize("Dr. Martens 1460!") == ["dr", "martens", "1460"]
+    assert tokenize(None) == []
+
+
+def test_id_bitmap_set_operations():
+    a = IdBitmap.from_ids([1, 5, 9, 64])
+    b = IdBitmap.from_ids([5, 64, 200])
+    assert list(a) == [1, 5, 9, 64]
+    assert len(a) == 4 and 9 in a and 2 not in a
+    assert list(a & b) == [5, 64]
+    assert list(a | b) == [1, 5, 9, 64, 200]
+    assert a & {1, 2, 64} == {1, 64}
+    assert {1, 2, 64} & a == {1, 64}
+    assert not IdBitmap.from_ids([]) and IdBitmap().ids() == set()
+
+
+def test_search_match_all_any_and_fuzzy(views):
+    index = _index(views)
+    assert index.search("running shoes") == {1, 2, 5, 6}
+    assert index.search("premium stability") == {5}
+    assert index.search("premium stability", match_all=False) == {2, 5, 6}
+    # Substring matches keep ILIKE '%tok%' semantics
+    assert index.search("boost") == {2}
+    assert index.search("convrse") == set()
+    assert index.search("convrse", fuzzy=True) == {3}
+    assert edit_distance("convrse", "converse", 2) == 1
+
+
+def test_bm25f_name_match_outranks_description_match():
+    index = _index([
+        make_view(1, "Trail Runner", "Sports", description="Lightweight shoe"),
+        make_view(2, "City Shoe", "Casual", description="Good for a trail walk"),
+        make_view(3, "Desert Boot", "Boots", description="Suede boot"),
+    ])
+    ranked = index.rank("trail", index.search("trail"))
+    assert [pid for pid, _ in ranked] == [1, 2]
+    assert ranked[0][1] > ranked[1][1] > 0
+
+
+def test_bm25f_exact_term_outranks_partial_match():
+    index = _index([
+        make_view(1, "Runners Pack", "Sports"),
+        make_view(2, "Run Club", "Sports"),
+    ])
+    assert [pid for pid, _ in index.rank("run", index.search("run"))] == [2, 1]
+
+
+def test_rank_top_k_and_after_paging(views):
+    index = _index(views)
+    candidates = index.search("shoes", match_all=False)
+    full = index.rank("running shoes", candidates)
+    assert [pid for pid, _ in full] == [pid for pid, _ in sorted(full, key=lambda h: (-h[1], h[0]))]
+    top = index.rank("running shoes", candidates, limit=2)
+    assert top == full[:2]
+    # Keyset paging by (score, id) walks the same order without repeats
+    pages, after = [], None
+    while True:
+        page = index.rank("running shoes", candidates, limit=2, after=after)
+        if not page:
+            break
+        pages += page
+        after = (page[-1][1], page[-1][0])
+    assert pages == full
+
+
+def test_upsert_and_remove_update_results(views):
+    index = _index(views)
+    index.upsert(make_view(7, "Birkenstock Running Sandal", "Sandals"))
+    assert 7 in index.search("running")
+    index.remove(1)
+    assert index.search("running shoes") == {2, 5, 6}
+    assert 1 not in index.filter_ids()
+    assert set(index.filter_ids(category="sneak")) == {5, 6}
+
+
+def test_price_buckets_match_their_filter_links():
+    prices = [10.0, 20.0, 25.0, 40.0, 50.0, 60.0, 99.5, 100.0]
+    index = _index([make_view(pid, f"Shoe {pid}", price=price) for pid, price in enumerate(prices, 1)])
+    histogram = index.price_histogram()
+    assert sum(bucket["count"] for bucket in histogram) == len(prices)
+    # The max sits exactly on an edge: it goes into the last bucket, not an extra one
+    assert histogram[-1]["high"] >= 100.0 > histogram[-1]["low"]
+    for bucket in histogram:
+        top = bucket["max"] if bucket["max"] is not None else bucket["low"]
+        assert len(index.filter_ids(min_price=bucket["low"], max_price=top)) == bucket["count"]
+
+
+def test_price_filter_bounds_are_inclusive(views):
+    index = _index(views)
+    assert set(index.filter_ids(min_price=150.0, max_price=175.0)) == {4, 5, 6}
+    assert len(index.price_histogram()) >= 1
+    single = _index([make_view(1, "Only", price=80.0)])
+    assert single.price_histogram() == [{"low": 80.0, "high": 81.0, "max": 80.0, "count": 1}]
+
+
+def test_popularity_rebuilds_completions_off_the_request_path(views):
+    index = _index(views)
+    index.set_popularity({2: 3})
+    assert index.suggest("a")[0]["text"] == "Adidas Ultraboost"
+    index.set_popularity({2: 3, 6: 5})
+    # Built by set_popularity itself, so the next keystroke does not pay for it
+    table = index._completions
+    assert table is not None
+    assert index.suggest("a")[0]["text"] == "ASICS Gel-Kayano"
+    index.set_popularity({2: 3, 6: 5})
+    assert index._completions is table
+    index.upsert(make_view(8, "Air Jordan 1", "Basketball"))
+    assert index.suggest("air jordan")[0]["text"] == "Air Jordan 1"
@@ -0,0 +1,31 @@
+from app.similarity import ContentSimilarity
+from conftest import make_view
+
+
+def test_query_and_similar(views):
+    similarity = ContentSimilarity()
+    similarity.build(views)
+    # Only the four running shoes share the query's words
+    assert set(similarity.query("running shoes", 7)) == {1, 2, 5, 6}
+    assert similarity.query("running shoes", 7, allowed={1, 7}) == [1]
+    assert similarity.query("boots", 1) == [4]
+    assert similarity.similar(5, 1) == [6]
+    assert 5 not in similarity.similar(5, 7, exclude={6})
+    assert similarity.similar(99, 2) == []
+
+
+def test_writes_match_a_fresh_build(views):
+    edited = make_view(2, "Adidas Samba", "Casual", 90.0, "Classic leather trainers")
+    incremental = ContentSimilarity()
+    incremental.build(views[:4])
+    for view in views[4:]:
+        incremental.upsert(view)
+    incremental.upsert(edited)
+    incremental.remove(4)
+    fresh = ContentSimilarity()
+    fresh.build([edited if v.id == 2 else v for v in views if v.id != 4])
+    for text in ("running shoes", "leather", "sandals"):
+        assert incremental.query(text, 5) == fresh.query(text, 5)
+    for pid in (1, 2, 3, 5, 6, 7):
+        assert incremental.similar(pid, 4) == fresh.similar(pid, 4)
+    assert incremental.similar(4, 4) == []